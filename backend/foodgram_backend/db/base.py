@@ -0,0 +1,140 @@
+import threading
+
+from django.db.backends.postgresql import base
+import psycopg2
+from psycopg2 import extras, pool
+
+
+class ConnectionPool(pool.ThreadedConnectionPool):
+    # psycopg2 оставляет возвращённое соединение в пуле, только пока
+    # свободных меньше minconn, и столько же открывает при создании.
+    # Здесь сразу открывается minconn соединений, а хранится до maxconn.
+    # Занятые места считает семафор: getconn() psycopg2 при исчерпании
+    # пула не ждёт, а сразу падает с PoolError.
+
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self.minconn = self.maxconn
+        self.slots = threading.BoundedSemaphore(self.maxconn)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # Бэкенд PostgreSQL с двумя дополнениями из настроек базы:
+    # CONN_HEALTH_CHECKS — переиспользуемое соединение проверяется перед
+    # первым запросом в каждом HTTP-запросе (как в Django 4.1);
+    # POOL_SIZE > 0 — соединения берутся из пула процесса и возвращаются
+    # в него вместо закрытия. Когда пул занят, поток ждёт до POOL_TIMEOUT
+    # секунд и получает OperationalError. С CONN_HEALTH_CHECKS соединение
+    # из пула проверяется запросом SELECT 1 и при ошибке заменяется новым.
+    # Пул свой для каждого набора параметров подключения: тестовый раннер
+    # меняет NAME, и соединения к прежней базе не должны переиспользоваться.
+    pools = {}
+    pools_lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+        self.pool = None
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def ensure_connection(self):
+        if (
+            self.connection is not None
+            and self.settings_dict.get('CONN_HEALTH_CHECKS')
+            and not self.health_check_done
+            and not self.in_atomic_block
+        ):
+            self.health_check_done = True
+            if not self.is_usable():
+                self.errors_occurred = True
+                self.close()
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def get_pool(self, conn_params):
+        key = (self.alias, repr(sorted(conn_params.items())))
+        with self.pools_lock:
+            if key not in self.pools:
+                self.pools[key] = ConnectionPool(
+                    self.settings_dict.get('POOL_MIN_SIZE', 0),
+                    self.settings_dict['POOL_SIZE'],
+                    **conn_params,
+                )
+            return self.pools[key]
+
+    def get_pooled_connection(self, connection_pool):
+        # Все соединения в пуле могут оказаться разорванными (перезапуск
+        # сервера БД), поэтому попыток на одну больше размера пула:
+        # последняя получает новое соединение
+        for _ in range(self.settings_dict['POOL_SIZE'] + 1):
+            connection = connection_pool.getconn()
+            if not self.settings_dict.get('CONN_HEALTH_CHECKS'):
+                return connection
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                connection.rollback()
+            except psycopg2.Error:
+                connection_pool.putconn(connection, close=True)
+            else:
+                return connection
+        raise psycopg2.OperationalError(
+            'Не удалось получить рабочее соединение из пула'
+        )
+
+    def get_new_connection(self, conn_params):
+        if not self.settings_dict.get('POOL_SIZE'):
+            return super().get_new_connection(conn_params)
+
+        connection_pool = self.get_pool(conn_params)
+        if not connection_pool.slots.acquire(
+            timeout=self.settings_dict.get('POOL_TIMEOUT')
+        ):
+            raise psycopg2.OperationalError(
+                'Пул соединений исчерпан: нет свободного соединения'
+            )
+        connection = None
+        try:
+            connection = self.get_pooled_connection(connection_pool)
+            self.configure_connection(connection)
+        except BaseException:
+            if connection is not None:
+                connection_pool.putconn(connection, close=True)
+            connection_pool.slots.release()
+            raise
+        self.pool = connection_pool
+        return connection
+
+    def configure_connection(self, connection):
+        # Та же настройка соединения, что и в базовом get_new_connection
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        extras.register_default_jsonb(
+            conn_or_curs=connection, loads=lambda x: x
+        )
+
+    def _close(self):
+        if self.pool is None:
+            return super()._close()
+        # Пул сам откатывает незавершённую транзакцию; сломанное
+        # соединение закрывается, а не возвращается
+        connection_pool, self.pool = self.pool, None
+        try:
+            with self.wrap_database_errors:
+                connection_pool.putconn(
+                    self.connection, close=self.errors_occurred
+                )
+        finally:
+            connection_pool.slots.release()
@@ -0,0 +1,123 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import SimpleTestCase
+import psycopg2
+from psycopg2 import extensions
+
+from foodgram_backend.db.base import DatabaseWrapper
+
+
+CONN_PARAMS = {'database': 'foodgram_db', 'user': 'foodgram_user'}
+
+
+class FakeConnection:
+    # Соединение psycopg2 в объёме, который нужен пулу и бэкенду
+
+    isolation_level = extensions.ISOLATION_LEVEL_READ_COMMITTED
+
+    def __init__(self, **params):
+        self.params = params
+        self.closed = 0
+        self.broken = False
+        self.info = mock.Mock(
+            transaction_status=extensions.TRANSACTION_STATUS_IDLE
+        )
+
+    def cursor(self):
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value = cursor
+        if self.broken:
+            cursor.execute.side_effect = psycopg2.OperationalError
+        return cursor
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class PooledDatabaseWrapperTest(SimpleTestCase):
+    # PostgreSQL здесь не нужен: пул psycopg2 настоящий,
+    # а psycopg2.connect возвращает FakeConnection
+
+    def setUp(self):
+        self.connections = []
+
+        def connect(**params):
+            self.connections.append(FakeConnection(**params))
+            return self.connections[-1]
+
+        for patcher in (
+            mock.patch('psycopg2.pool.psycopg2.connect', connect),
+            mock.patch('foodgram_backend.db.base.extras'),
+            mock.patch.dict(DatabaseWrapper.pools, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def make_wrapper(self, **settings):
+        settings_dict = {
+            **connection.settings_dict,
+            'OPTIONS': {},
+            'POOL_SIZE': 2,
+            'CONN_HEALTH_CHECKS': True,
+            'POOL_TIMEOUT': 0.01,
+            **settings,
+        }
+        return DatabaseWrapper(settings_dict, alias='pool-test')
+
+    def get(self, wrapper, conn_params=CONN_PARAMS):
+        wrapper.connection = wrapper.get_new_connection(conn_params)
+        return wrapper.connection
+
+    def put(self, wrapper):
+        wrapper._close()
+        wrapper.connection = None
+
+    def test_reuses_returned_connection(self):
+        wrapper = self.make_wrapper()
+        first = self.get(wrapper)
+        self.put(wrapper)
+        self.assertIs(self.get(wrapper), first)
+        self.assertFalse(first.closed)
+        self.assertEqual(len(self.connections), 1)
+
+    def test_replaces_broken_connection(self):
+        wrapper = self.make_wrapper()
+        broken = self.get(wrapper)
+        self.put(wrapper)
+        broken.broken = True
+        fresh = self.get(wrapper)
+        self.assertIsNot(fresh, broken)
+        self.assertTrue(broken.closed)
+
+    def test_closes_connection_after_error(self):
+        wrapper = self.make_wrapper()
+        first = self.get(wrapper)
+        wrapper.errors_occurred = True
+        self.put(wrapper)
+        self.assertTrue(first.closed)
+        self.assertIsNot(self.get(wrapper), first)
+
+    def test_waits_for_free_connection(self):
+        first = self.make_wrapper(POOL_SIZE=1)
+        second = self.make_wrapper(POOL_SIZE=1)
+        self.get(first)
+        with self.assertRaises(psycopg2.OperationalError):
+            self.get(second)
+        self.put(first)
+        self.get(second)
+        self.assertEqual(len(self.connections), 1)
+
+    def test_pool_per_connection_params(self):
+        wrapper = self.make_wrapper()
+        self.get(wrapper)
+        self.put(wrapper)
+        test_connection = self.get(
+            wrapper, {**CONN_PARAMS, 'database': 'test_foodgram_db'}
+        )
+        self.assertEqual(
+            test_connection.params['database'], 'test_foodgram_db'
+        )
@@ -48,7 +48,7 @@ REST_FRAMEWORK = {
     'PAGE_SIZE':
         6,
     'DEFAULT_AUTHENTICATION_CLASSES':
-        ['rest_framework.authentication.TokenAuthentication'],
+        ['users.authentication.CachedTokenAuthentication'],
 }
 
 ROOT_URLCONF = 'foodgram_backend.urls'
@@ -79,17 +79,56 @@ if os.getenv('USE_SQLITE').lower() == 'true':
         }
     }
 else:
+    # DB_POOL_SIZE > 0 включает пул соединений в каждом воркере (размер —
+    # не меньше числа потоков воркера); соединения тогда возвращаются в пул
+    # в конце запроса, и CONN_MAX_AGE не используется
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 0))
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.postgresql',
+            'ENGINE': 'foodgram_backend.db',
             'NAME': os.getenv('POSTGRES_DB', 'foodgram_db'),
             'USER': os.getenv('POSTGRES_USER', 'foodgram_user'),
             'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
             'HOST': os.getenv('DB_HOST', 'db'),
-            'PORT': os.getenv('DB_PORT', '5432')
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': (
+                0 if DB_POOL_SIZE
+                else int(os.getenv('DB_CONN_MAX_AGE', 60))
+            ),
+            'CONN_HEALTH_CHECKS': (
+                os.getenv('DB_HEALTH_CHECKS', 'true').lower() == 'true'
+            ),
+            'POOL_SIZE': DB_POOL_SIZE,
+            'POOL_MIN_SIZE': int(os.getenv('DB_POOL_MIN_SIZE', 0)),
+            'POOL_TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 10)),
         }
     }
 
+LOCMEM_CACHE = 'django.core.cache.backends.locmem.LocMemCache'
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', LOCMEM_CACHE),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Кэш множеств избранного, корзины и подписок пользователя между запросами
+# (секунды; 0 — только в пределах запроса)
+USER_RELATIONS_CACHE_TIMEOUT = int(
+    os.getenv('USER_RELATIONS_CACHE_TIMEOUT', 0)
+)
+
+# Кэш пользователя по токену: в памяти процесса (секунды; 0 — выключен)
+# и в общем кэше (секунды; 0 — не использовать). Отзыв токена доходит
+# до других воркеров только через общий CACHE_BACKEND, поэтому с LocMemCache
+# кэш процесса по умолчанию выключен
+TOKEN_CACHE_SIZE = 1024
+TOKEN_CACHE_TIMEOUT = int(os.getenv(
+    'TOKEN_CACHE_TIMEOUT',
+    0 if CACHES['default']['BACKEND'] == LOCMEM_CACHE else 60,
+))
+TOKEN_CACHE_SHARED_TIMEOUT = int(os.getenv('TOKEN_CACHE_SHARED_TIMEOUT', 0))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME':
@@ -135,11 +174,32 @@ SIMPLE_JWT = {
 
 DJOSER = {
     'LOGIN_FIELD': 'email',
+    'SERIALIZERS': {
+        'token_create': 'users.serializers.TokenCreateSerializer',
+    },
 }
 
+AUTHENTICATION_BACKENDS = [
+    'users.backends.EmailBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 AUTH_USER_MODEL = 'users.CustomUser'
 
 CHAR_NAME = 254
 MIN_VALUE = 1
 MAX_VALUE = 32_000
-FILE_NAME_LENGTH = 12
+INGREDIENT_SEARCH_LIMIT = 20
+RECIPE_MATCH_LIMIT = 100
+RECIPE_MATCH_INDEX_TTL = 60 * 60
+RECIPE_CACHE_MAX_AGE = 60
+RECIPE_BATCH_SIZE = 100
+IMAGE_VARIANTS = {
+    'thumbnail': (320, 320),
+    'detail': (1024, 1024),
+}
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+MAX_IMAGE_PIXELS = 40_000_000
+IMAGE_SPOOL_SIZE = 1024 * 1024
@@ -0,0 +1,21 @@
+from recipes.models import RecipeActivity
+
+
+def record_activity(recipe_ids, kind):
+    RecipeActivity.objects.bulk_create(
+        RecipeActivity(recipe_id=recipe_id, kind=kind)
+        for recipe_id in recipe_ids
+    )
+
+
+def activity_recorder(kind):
+    # Обработчик m2m_changed для добавлений через ORM и админку;
+    # в post_add приходят только реально добавленные связи
+
+    def receiver(sender, instance, action, reverse, pk_set, **kwargs):
+        if action == 'post_add' and pk_set:
+            record_activity(
+                pk_set if reverse else [instance.pk] * len(pk_set), kind
+            )
+
+    return receiver
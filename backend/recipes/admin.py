@@ -7,7 +7,7 @@ from recipes.models import Ingredient, Recipe
 class RecipeAdmin(admin.ModelAdmin):
     list_display = (
         'name', 'display_ingredients', 'display_tags', 'image', 'cooking_time',
-        'text', 'author', 'created_at', 'updated_at', 'display_favorites'
+        'text', 'author', 'created_at', 'updated_at', 'favorites_count'
     )
     search_fields = ('name',)
     list_filter = ('name', 'author__username', 'tags__name')
@@ -24,11 +24,6 @@ class RecipeAdmin(admin.ModelAdmin):
 
     display_tags.short_description = 'Тэги'
 
-    def display_favorites(self, obj):
-        return obj.is_favorited.count()
-
-    display_favorites.short_description = 'Добавлено в избранное'
-
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
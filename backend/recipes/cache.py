@@ -0,0 +1,201 @@
+from hashlib import md5
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+from django.http import HttpResponse
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date
+from rest_framework.generics import get_object_or_404
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from users.relations import get_relations
+
+
+TAGS_CACHE = 'tags'
+INGREDIENTS_CACHE = 'ingredients'
+RECIPES_CACHE = 'recipes'
+DELETED_RECIPES_CACHE = 'deleted_recipes'
+
+
+def version_key(namespace):
+    return f'{namespace}:version'
+
+
+def get_version(namespace):
+    version = cache.get(version_key(namespace))
+    if version is None:
+        # Стартовое значение от времени, чтобы после вытеснения ключа
+        # версии не совпали со старыми закэшированными ответами.
+        # Ключ версии бессрочный: с таймаутом по умолчанию он пропадал бы
+        # каждые 300 секунд и сбрасывал все зависящие от него кэши
+        cache.add(version_key(namespace), time.time_ns(), timeout=None)
+        version = cache.get(version_key(namespace))
+    return version
+
+
+def bump_version(namespace):
+    try:
+        cache.incr(version_key(namespace))
+    except ValueError:
+        cache.add(version_key(namespace), time.time_ns(), timeout=None)
+
+
+class CachedListMixin:
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        key = '{}:{}:list:{}'.format(
+            self.cache_namespace,
+            get_version(self.cache_namespace),
+            md5(request.get_full_path().encode()).hexdigest(),
+        )
+        cached = cache.get(key)
+        if cached is None:
+            data = super().list(request, *args, **kwargs).data
+            content = JSONRenderer().render(data)
+            cached = (f'"{md5(content).hexdigest()}"', content)
+            cache.set(key, cached)
+
+        etag, content = cached
+        response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        return get_conditional_response(request, etag=etag, response=response)
+
+
+# Поля рецепта, от которых зависит ответ: updated_at сдвигается при
+# изменении самого рецепта, его тегов и ингредиентов (recipes.signals),
+# данные автора выводятся в рецепте, но в updated_at не отражаются
+ETAG_FIELDS = (
+    'id',
+    'updated_at',
+    'author_id',
+    'author__email',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+)
+
+
+class ConditionalRecipeMixin:
+    # ETag рецептов строится лёгким запросом полей ETAG_FIELDS и отношений
+    # пользователя к рецептам; рецепты с тегами и ингредиентами загружаются
+    # и сериализуются только при промахе. Ответы анонимам кэшируются
+    # прокси (nginx). Валидаторы зависят только от базы и совпадают во всех
+    # воркерах.
+
+    def retrieve(self, request, *args, **kwargs):
+        queryset = self.annotate_relations(
+            self.get_queryset().model.objects.all()
+        )
+        recipe = get_object_or_404(
+            queryset.values(*ETAG_FIELDS, *queryset.query.annotations),
+            pk=kwargs[self.lookup_field],
+        )
+        etag = self.get_etag([recipe])
+        last_modified = int(recipe['updated_at'].timestamp())
+        response = self.get_conditional_response(etag, last_modified)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        return self.patch_cache_headers(response, etag, last_modified)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        # created_at нужен курсорной пагинации для ссылок
+        rows = queryset.select_related(None).prefetch_related(None).values(
+            *ETAG_FIELDS, 'created_at'
+        )
+        page = self.paginate_queryset(rows)
+        rows = list(rows) if page is None else page
+        # Ссылки и count страницы без сериализации рецептов
+        pagination = (
+            None if page is None
+            else self.get_paginated_response([]).data
+        )
+        # Last-Modified у списка не отправляется: max(updated_at) страницы
+        # не меняется, когда рецепт удалён или страница сдвинулась
+        etag = self.get_etag(rows, pagination)
+        response = self.get_conditional_response(etag)
+        if response is None:
+            ids = [row['id'] for row in rows]
+            found = queryset.model.objects.for_reading().in_bulk(ids)
+            serializer = self.get_serializer(
+                [found[pk] for pk in ids if pk in found], many=True
+            )
+            response = (
+                Response(serializer.data) if page is None
+                else self.get_paginated_response(serializer.data)
+            )
+        return self.patch_cache_headers(response, etag)
+
+    def annotate_relations(self, queryset):
+        # Для одного рецепта отношения проверяются в том же запросе,
+        # без загрузки всех множеств пользователя
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset
+        model = queryset.model
+        return queryset.annotate(
+            favorited=Exists(
+                model.objects.filter(pk=OuterRef('pk'), is_favorited=user)
+            ),
+            in_shopping_cart=Exists(
+                model.objects.filter(
+                    pk=OuterRef('pk'), is_in_shopping_cart=user
+                )
+            ),
+            subscribed=Exists(
+                user.subscriptions.filter(pk=OuterRef('author_id'))
+            ),
+        )
+
+    def relation_flags(self, recipe):
+        if 'favorited' in recipe:
+            return (
+                recipe['favorited'],
+                recipe['in_shopping_cart'],
+                recipe['subscribed'],
+            )
+        relations = get_relations(self.request)
+        return (
+            recipe['id'] in relations.favorited,
+            recipe['id'] in relations.in_shopping_cart,
+            recipe['author_id'] in relations.subscriptions,
+        )
+
+    def get_etag(self, recipes, *extra):
+        parts = [self.request.get_full_path(), *extra]
+        for recipe in recipes:
+            parts.append((
+                *(recipe[field] for field in ETAG_FIELDS),
+                *self.relation_flags(recipe),
+            ))
+        return f'"{md5(repr(parts).encode()).hexdigest()}"'
+
+    def get_conditional_response(self, etag, last_modified=None):
+        # Отношения пользователя не отражаются в updated_at, поэтому
+        # If-Modified-Since учитывается только для анонимов
+        if self.request.user.is_authenticated:
+            last_modified = None
+        return get_conditional_response(
+            self.request, etag=etag, last_modified=last_modified
+        )
+
+    def patch_cache_headers(self, response, etag, last_modified=None):
+        response['ETag'] = etag
+        if self.request.user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(
+                response, public=True, max_age=settings.RECIPE_CACHE_MAX_AGE
+            )
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Authorization',))
+        return response
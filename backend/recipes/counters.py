@@ -0,0 +1,216 @@
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from users.relations import invalidate_relations
+
+
+def change_counter(queryset, counter_field, delta):
+    queryset.update(**{counter_field: Greatest(F(counter_field) + delta, 0)})
+
+
+def m2m_counter(field_name, counter_field):
+    # Обработчик m2m_changed, который поддерживает counter_field на модели,
+    # объявившей ManyToManyField field_name, для прямой и обратной стороны
+
+    def receiver(sender, instance, action, reverse, model, pk_set, **kwargs):
+        if action in ('post_add', 'pre_remove'):
+            if not pk_set:
+                return
+            if action == 'pre_remove':
+                # В pk_set приходят все запрошенные id, а не только
+                # существующие связи, поэтому вычитаются реально удаляемые
+                pk_set = existing_relations(
+                    instance, reverse, model, field_name, pk_set
+                )
+            delta = 1 if action == 'post_add' else -1
+            if reverse:
+                change_counter(
+                    model.objects.filter(pk__in=pk_set), counter_field, delta
+                )
+            elif pk_set:
+                change_counter(
+                    type(instance).objects.filter(pk=instance.pk),
+                    counter_field,
+                    delta * len(pk_set),
+                )
+        elif action == 'pre_clear':
+            if reverse:
+                change_counter(
+                    model.objects.filter(**{field_name: instance}),
+                    counter_field,
+                    -1,
+                )
+            else:
+                type(instance).objects.filter(pk=instance.pk).update(
+                    **{counter_field: 0}
+                )
+
+    return receiver
+
+
+def existing_relations(instance, reverse, model, field_name, pk_set):
+    through, source, target = relation_through(
+        model if reverse else type(instance), field_name
+    )
+    if reverse:
+        return list(through.objects.filter(
+            **{f'{target}_id': instance.pk, f'{source}_id__in': pk_set}
+        ).values_list(f'{source}_id', flat=True))
+    return list(through.objects.filter(
+        **{f'{source}_id': instance.pk, f'{target}_id__in': pk_set}
+    ).values_list(f'{target}_id', flat=True))
+
+
+def count_subquery(queryset, field_name):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field_name: OuterRef('pk')}).order_by().values(
+                field_name
+            ).annotate(total=Count('*')).values('total')
+        ),
+        0,
+    )
+
+
+def recount(model, counter_field, queryset, field_name):
+    model.objects.update(
+        **{counter_field: count_subquery(queryset, field_name)}
+    )
+
+
+def relation_through(model, field_name):
+    # Промежуточная модель ManyToManyField и имена её полей:
+    # объявившая поле модель и пользователь на стороне «to»
+    field = model._meta.get_field(field_name)
+    return (
+        field.remote_field.through,
+        field.m2m_field_name(),
+        field.m2m_reverse_field_name(),
+    )
+
+
+def supports_returning():
+    # INSERT ... ON CONFLICT DO NOTHING и DELETE ... RETURNING есть
+    # в PostgreSQL и в SQLite начиная с 3.35
+    if connection.vendor == 'postgresql':
+        return True
+    return (
+        connection.vendor == 'sqlite'
+        and connection.Database.sqlite_version_info >= (3, 35)
+    )
+
+
+def relation_columns(through, source, target):
+    quote = connection.ops.quote_name
+    return (
+        quote(through._meta.db_table),
+        quote(through._meta.get_field(source).column),
+        quote(through._meta.get_field(target).column),
+    )
+
+
+def insert_relations(through, source, target, pks, user_pk):
+    # Уникальный индекс промежуточной таблицы отсекает уже существующие
+    # связи, RETURNING возвращает только реально вставленные строки
+    if not supports_returning():
+        existing = set(
+            through.objects.filter(
+                **{f'{source}_id__in': pks, f'{target}_id': user_pk}
+            ).values_list(f'{source}_id', flat=True)
+        )
+        added = [pk for pk in pks if pk not in existing]
+        through.objects.bulk_create(
+            [
+                through(**{f'{source}_id': pk, f'{target}_id': user_pk})
+                for pk in added
+            ],
+            ignore_conflicts=True,
+        )
+        return added
+
+    table, source_column, target_column = relation_columns(
+        through, source, target
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({source_column}, {target_column}) '
+            f'VALUES {", ".join(["(%s, %s)"] * len(pks))} '
+            f'ON CONFLICT DO NOTHING RETURNING {source_column}',
+            [value for pk in pks for value in (pk, user_pk)],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def delete_relations(through, source, target, pks, user_pk):
+    if not supports_returning():
+        relations = through.objects.filter(
+            **{f'{source}_id__in': pks, f'{target}_id': user_pk}
+        )
+        removed = list(relations.values_list(f'{source}_id', flat=True))
+        relations.delete()
+        return removed
+
+    table, source_column, target_column = relation_columns(
+        through, source, target
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE {target_column} = %s '
+            f'AND {source_column} IN ({", ".join(["%s"] * len(pks))}) '
+            f'RETURNING {source_column}',
+            [user_pk, *pks],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def prepare_pks(model, pks):
+    # В сырой SQL id попадают без приведения типов ORM
+    return [model._meta.pk.get_prep_value(pk) for pk in pks]
+
+
+# Прямые операции с промежуточной моделью не отправляют m2m_changed,
+# поэтому счётчики и кэш отношений обновляются здесь же. Связь вставляется
+# и удаляется одним запросом без предварительной проверки, поэтому
+# параллельные запросы не меняют счётчик дважды
+
+@transaction.atomic
+def add_relations(model, pks, field_name, counter_field, user, kind):
+    if not pks:
+        return []
+    through, source, target = relation_through(model, field_name)
+    added = insert_relations(
+        through, source, target, prepare_pks(model, pks), user.pk
+    )
+    if added:
+        change_counter(model.objects.filter(pk__in=added), counter_field, 1)
+        invalidate_relations([user.pk], kind)
+    return added
+
+
+@transaction.atomic
+def remove_relations(model, pks, field_name, counter_field, user, kind):
+    if not pks:
+        return []
+    through, source, target = relation_through(model, field_name)
+    removed = delete_relations(
+        through, source, target, prepare_pks(model, pks), user.pk
+    )
+    if removed:
+        change_counter(
+            model.objects.filter(pk__in=removed), counter_field, -1
+        )
+        invalidate_relations([user.pk], kind)
+    return removed
+
+
+def add_relation(model, pk, field_name, counter_field, user, kind):
+    return bool(
+        add_relations(model, [pk], field_name, counter_field, user, kind)
+    )
+
+
+def remove_relation(model, pk, field_name, counter_field, user, kind):
+    return bool(
+        remove_relations(model, [pk], field_name, counter_field, user, kind)
+    )
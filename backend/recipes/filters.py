@@ -1,11 +1,22 @@
+from django.conf import settings
+from django.db.models import Case, When
 from django_filters import rest_framework as filters
 
 from recipes.models import Ingredient
+from recipes.search import ingredient_index
 
 
 class IngredientFilter(filters.FilterSet):
-    name = filters.CharFilter(field_name='name', lookup_expr='istartswith')
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
+
+    def filter_name(self, queryset, name, value):
+        ids = ingredient_index.search(value, settings.INGREDIENT_SEARCH_LIMIT)
+        if not ids:
+            return queryset.none()
+        return queryset.filter(pk__in=ids).order_by(
+            Case(*[When(pk=pk, then=rank) for rank, pk in enumerate(ids)])
+        )
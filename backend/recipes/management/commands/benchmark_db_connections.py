@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from foodgram_backend.db.base import DatabaseWrapper
+
+
+REQUESTS = 200
+# Режим -> настройки поверх DATABASES['default']
+MODES = {
+    'Соединение на запрос': {'CONN_MAX_AGE': 0, 'POOL_SIZE': 0},
+    'Постоянное соединение': {'CONN_MAX_AGE': None, 'POOL_SIZE': 0},
+    'Пул соединений': {'CONN_MAX_AGE': 0, 'POOL_SIZE': 1},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает накладные расходы на соединение с PostgreSQL за запрос: '
+        'новое соединение, постоянное соединение и пул'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', default=REQUESTS, type=int)
+
+    def handle(self, *args, **options):
+        settings_dict = connections[DEFAULT_DB_ALIAS].settings_dict
+        if settings_dict['ENGINE'] != 'foodgram_backend.db':
+            raise CommandError('Нужна база PostgreSQL (USE_SQLITE не задан)')
+
+        for number, (mode, overrides) in enumerate(MODES.items()):
+            wrapper = DatabaseWrapper(
+                {**settings_dict, **overrides}, f'benchmark-{number}'
+            )
+            elapsed = self.run_requests(wrapper, options['requests'])
+            self.stdout.write(
+                f'{mode}: {elapsed / options["requests"] * 1000:.2f} мс '
+                'на запрос'
+            )
+
+    def run_requests(self, wrapper, count):
+        # Как в обработке HTTP-запроса: close_old_connections по сигналам
+        # request_started и request_finished и один короткий запрос
+        started = time.perf_counter()
+        for _ in range(count):
+            wrapper.close_if_unusable_or_obsolete()
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            wrapper.close_if_unusable_or_obsolete()
+        elapsed = time.perf_counter() - started
+        wrapper.close()
+        return elapsed
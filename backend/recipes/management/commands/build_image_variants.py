@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.thumbnails import build_variants
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные копии изображений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Перестроить копии и для уже обработанных рецептов',
+        )
+
+    def handle(self, *args, **options):
+        built = failed = 0
+        recipes = Recipe.objects.exclude(image='').order_by().values_list(
+            'id', 'image', 'image_variants'
+        )
+        for recipe_id, image, variants in recipes.iterator():
+            if not options['all'] and variants.get('source') == image:
+                continue
+            try:
+                build_variants(recipe_id, image, force=options['all'])
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{image}: {error}')
+            else:
+                built += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {built}, с ошибками: {failed}'
+        ))
@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import Recipe
+from recipes.thumbnails import VARIANTS_DIR
+
+
+BATCH_SIZE = 1000
+# Файл сохраняется (или переиспользуется с обновлением времени изменения)
+# до коммита рецепта, поэтому свежие файлы без ссылок не удаляются
+GRACE_PERIOD_HOURS = 24
+
+
+class Command(BaseCommand):
+    help = 'Удаляет изображения, на которые не ссылается ни один рецепт'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', default=BATCH_SIZE, type=int)
+        parser.add_argument(
+            '--grace-hours', default=GRACE_PERIOD_HOURS, type=int
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы, которые будут удалены',
+        )
+
+    def handle(self, *args, **options):
+        field = Recipe._meta.get_field('image')
+        storage = field.storage
+        upload_dir = field.upload_to
+
+        started = timezone.now()
+        referenced = self.referenced(
+            Recipe.objects.all(), options['batch_size']
+        )
+
+        deadline = started - timedelta(hours=options['grace_hours'])
+        candidates = []
+        for directory in (upload_dir, VARIANTS_DIR):
+            if not storage.exists(directory):
+                continue
+            for file_name in storage.listdir(directory)[1]:
+                name = directory + file_name
+                if (
+                    name not in referenced
+                    and storage.get_modified_time(name) <= deadline
+                ):
+                    candidates.append(name)
+
+        # Рецепты, сохранённые во время обхода, могли сослаться на файл
+        # из кандидатов: перед удалением ссылки проверяются ещё раз
+        referenced = self.referenced(
+            Recipe.objects.filter(updated_at__gte=started),
+            options['batch_size'],
+        )
+        removed = size = 0
+        for name in candidates:
+            if (
+                name in referenced
+                or storage.get_modified_time(name) > deadline
+            ):
+                continue
+            removed += 1
+            size += storage.size(name)
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                storage.delete(name)
+
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {removed}, {size} байт'
+        ))
+
+    def referenced(self, recipes, batch_size):
+        referenced = set()
+        rows = recipes.order_by().values_list(
+            'image', 'image_variants'
+        ).iterator(chunk_size=batch_size)
+        for image, variants in rows:
+            referenced.add(image)
+            referenced.update(
+                name for key, name in variants.items() if key != 'source'
+            )
+        return referenced
@@ -0,0 +1,88 @@
+import csv
+from functools import partial
+from itertools import islice
+import json
+from pathlib import Path
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.cache import INGREDIENTS_CACHE, TAGS_CACHE, bump_version
+from recipes.models import Ingredient, Tag
+
+
+BATCH_SIZE = 1000
+
+
+def read_ingredients(path):
+    csv_path = path / 'ingredients.csv'
+    if csv_path.exists():
+        with open(csv_path, encoding='utf-8', newline='') as file:
+            for name, measurement_unit in csv.reader(file):
+                yield Ingredient(
+                    name=name, measurement_unit=measurement_unit
+                )
+        return
+
+    with open(path / 'ingredients.json', encoding='utf-8') as file:
+        for item in json.load(file):
+            yield Ingredient(
+                name=item['name'], measurement_unit=item['measurement_unit']
+            )
+
+
+def read_tags(path):
+    with open(path / 'tags.json', encoding='utf-8') as file:
+        for item in json.load(file):
+            yield Tag(
+                name=item['name'], color=item['color'], slug=item['slug']
+            )
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты и теги; повторный запуск не создаёт дублей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=settings.BASE_DIR / 'data',
+            type=Path,
+            help='Каталог с ingredients.csv/ingredients.json и tags.json',
+        )
+        parser.add_argument('--batch-size', default=BATCH_SIZE, type=int)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not path.is_dir():
+            raise CommandError(f'Каталог {path} не найден')
+
+        for model, rows, namespace in (
+            (Ingredient, read_ingredients(path), INGREDIENTS_CACHE),
+            (Tag, read_tags(path), TAGS_CACHE),
+        ):
+            self.load(model, rows, namespace, options['batch_size'])
+
+    def load(self, model, rows, namespace, batch_size):
+        started = time.perf_counter()
+        total = 0
+        with transaction.atomic():
+            before = model.objects.count()
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+                total += len(batch)
+            created = model.objects.count() - before
+            # bulk_create не отправляет post_save, поэтому версия кэша
+            # списка поднимается вручную
+            if created:
+                transaction.on_commit(partial(bump_version, namespace))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{model._meta.verbose_name_plural}: прочитано {total}, '
+            f'добавлено {created}, {total / elapsed:.0f} строк/с'
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import recount
+from recipes.models import Recipe, User
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики избранного, корзины, подписчиков и рецептов'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        recount(
+            Recipe, 'favorites_count',
+            Recipe.is_favorited.through.objects, 'recipe_id'
+        )
+        recount(
+            Recipe, 'shopping_cart_count',
+            Recipe.is_in_shopping_cart.through.objects, 'recipe_id'
+        )
+        recount(
+            User, 'subscribers_count',
+            User.subscribers.through.objects, 'from_customuser_id'
+        )
+        recount(User, 'recipes_count', Recipe.objects, 'author_id')
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
@@ -0,0 +1,93 @@
+from collections import defaultdict
+from datetime import timedelta
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from recipes.models import Recipe, RecipeActivity, RecipeRanking
+
+
+BATCH_SIZE = 1000
+# Вес добавления в корзину относительно добавления в избранное
+CART_WEIGHT = 2
+WEIGHTS = {
+    RecipeActivity.FAVORITED: 1,
+    RecipeActivity.IN_SHOPPING_CART: CART_WEIGHT,
+}
+# Скорость «остывания» активности в трендах, как в ранжировании Hacker News
+GRAVITY = 1.5
+# Активность старше окна в тренды не входит и удаляется
+TRENDING_WINDOW_HOURS = 72
+
+
+def score(favorites_count, shopping_cart_count):
+    return favorites_count + CART_WEIGHT * shopping_cart_count
+
+
+def decay(created_at, now):
+    age_hours = max((now - created_at).total_seconds(), 0) / 3600
+    return 1 / (age_hours + 2) ** GRAVITY
+
+
+def trending_scores(since, now):
+    # Добавления за окно, сгруппированные по часам: каждое весит тем
+    # меньше, чем раньше произошло, независимо от возраста рецепта
+    scores = defaultdict(float)
+    rows = RecipeActivity.objects.filter(created_at__gte=since).annotate(
+        hour=TruncHour('created_at')
+    ).values_list('recipe_id', 'kind', 'hour').annotate(
+        total=Count('id')
+    ).order_by()
+    for recipe_id, kind, hour, total in rows.iterator():
+        scores[recipe_id] += WEIGHTS[kind] * total * decay(hour, now)
+    return scores
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинги для сортировки popular и trending'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', default=BATCH_SIZE, type=int)
+        parser.add_argument(
+            '--window-hours', default=TRENDING_WINDOW_HOURS, type=int
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        since = now - timedelta(hours=options['window_hours'])
+        trending = trending_scores(since, now)
+        rows = Recipe.objects.order_by().values_list(
+            'id', 'favorites_count', 'shopping_cart_count'
+        ).iterator(chunk_size=options['batch_size'])
+
+        total = 0
+        while True:
+            batch = list(islice(rows, options['batch_size']))
+            if not batch:
+                break
+            rankings = [
+                RecipeRanking(
+                    recipe_id=recipe_id,
+                    popularity=score(favorites, carts),
+                    trending=trending.get(recipe_id, 0),
+                    refreshed_at=now,
+                )
+                for recipe_id, favorites, carts in batch
+            ]
+            with transaction.atomic():
+                RecipeRanking.objects.bulk_create(
+                    rankings, ignore_conflicts=True
+                )
+                RecipeRanking.objects.bulk_update(
+                    rankings, ('popularity', 'trending', 'refreshed_at')
+                )
+            total += len(rankings)
+
+        RecipeActivity.objects.filter(created_at__lt=since).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинги пересчитаны для {total} рецептов'
+        ))
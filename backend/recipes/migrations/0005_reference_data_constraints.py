@@ -0,0 +1,59 @@
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def merge_duplicates(model, through, fields, field_name):
+    duplicates = model.objects.values(*fields).annotate(
+        keep_id=Min('id'), total=models.Count('id')
+    ).filter(total__gt=1)
+    for duplicate in duplicates:
+        keep_id = duplicate.pop('keep_id')
+        duplicate.pop('total')
+        extra_ids = model.objects.filter(**duplicate).exclude(
+            id=keep_id
+        ).values_list('id', flat=True)
+        through.objects.filter(**{f'{field_name}_id__in': extra_ids}).update(
+            **{f'{field_name}_id': keep_id}
+        )
+        model.objects.filter(id__in=extra_ids).delete()
+
+
+def merge_reference_duplicates(apps, schema_editor):
+    merge_duplicates(
+        apps.get_model('recipes', 'Ingredient'),
+        apps.get_model('recipes', 'RecipeIngredient'),
+        ('name', 'measurement_unit'),
+        'ingredient',
+    )
+    merge_duplicates(
+        apps.get_model('recipes', 'Tag'),
+        apps.get_model('recipes', 'RecipeTag'),
+        ('slug',),
+        'tag',
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_alter_recipe_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_reference_duplicates, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(
+                fields=('name', 'measurement_unit'), name='unique_ingredient'
+            ),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='slug',
+            field=models.SlugField(
+                max_length=254, unique=True, verbose_name='Слаг'
+            ),
+        ),
+    ]
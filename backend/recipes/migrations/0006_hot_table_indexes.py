@@ -0,0 +1,60 @@
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def delete_duplicate_rows(apps, schema_editor):
+    for model_name, field in (
+        ('RecipeIngredient', 'ingredient'),
+        ('RecipeTag', 'tag'),
+    ):
+        model = apps.get_model('recipes', model_name)
+        keep_ids = model.objects.order_by().values('recipe', field).annotate(
+            keep_id=Min('id')
+        ).values_list('keep_id', flat=True)
+        model.objects.exclude(id__in=keep_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_reference_data_constraints'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_rows, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='recipe',
+            options={
+                'ordering': ('-created_at', '-id'),
+                'verbose_name': 'Рецепт',
+                'verbose_name_plural': 'Рецепты'
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='recipeingredient',
+            options={
+                'ordering': ('id',),
+                'verbose_name': 'Ингредиент рецепта',
+                'verbose_name_plural': 'Ингредиенты рецепта'
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(
+                fields=['created_at', 'id'], name='recipe_created_at_idx'
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name='recipeingredient',
+            constraint=models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                name='unique_recipe_ingredient'
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name='recipetag',
+            constraint=models.UniqueConstraint(
+                fields=('recipe', 'tag'), name='unique_recipe_tag'
+            ),
+        ),
+    ]
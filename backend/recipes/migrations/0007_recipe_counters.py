@@ -0,0 +1,51 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    for field, counter_field in (
+        ('is_favorited', 'favorites_count'),
+        ('is_in_shopping_cart', 'shopping_cart_count'),
+    ):
+        through = getattr(Recipe, field).through
+        Recipe.objects.update(**{
+            counter_field: Coalesce(
+                Subquery(
+                    through.objects.filter(
+                        recipe_id=OuterRef('pk')
+                    ).order_by().values('recipe_id').annotate(
+                        total=Count('*')
+                    ).values('total')
+                ),
+                0,
+            )
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_hot_table_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                verbose_name='Добавлено в избранное'
+            ),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name='Добавлено в корзину'
+            ),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
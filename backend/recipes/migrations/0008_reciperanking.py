@@ -0,0 +1,48 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeRanking',
+            fields=[
+                (
+                    'recipe',
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name='ranking',
+                        serialize=False,
+                        to='recipes.recipe',
+                        verbose_name='Рецепт'
+                    )
+                ),
+                (
+                    'popularity',
+                    models.FloatField(
+                        db_index=True, default=0, verbose_name='Популярность'
+                    )
+                ),
+                (
+                    'trending',
+                    models.FloatField(
+                        db_index=True, default=0, verbose_name='Тренд'
+                    )
+                ),
+                (
+                    'refreshed_at',
+                    models.DateTimeField(verbose_name='Дата пересчёта')
+                ),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+            },
+        ),
+    ]
@@ -0,0 +1,74 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# DDL и заполнение индекса записаны здесь целиком, а не импортируются из
+# recipes.search: миграция не должна зависеть от текущего кода приложения
+
+INGREDIENT_NAMES = (
+    'SELECT {aggregate} FROM recipes_recipeingredient ri '
+    'JOIN recipes_ingredient i ON i.id = ri.ingredient_id '
+    'WHERE ri.recipe_id = recipe.id'
+)
+
+
+def create_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS recipe_search_vector_idx '
+                'ON recipes_recipe USING gin (search_vector)'
+            )
+            names = INGREDIENT_NAMES.format(
+                aggregate="string_agg(i.name, ' ')"
+            )
+            cursor.execute(
+                'UPDATE recipes_recipe AS recipe SET search_vector = '
+                "setweight(to_tsvector('russian', recipe.name), 'A') || "
+                "setweight(to_tsvector('russian', recipe.text), 'B') || "
+                "setweight(to_tsvector('russian', "
+                f"coalesce(({names}), '')), 'C')"
+            )
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts '
+                'USING fts5(name, text, ingredients, '
+                "tokenize = 'unicode61 remove_diacritics 0')"
+            )
+            names = INGREDIENT_NAMES.format(
+                aggregate="group_concat(i.name, ' ')"
+            )
+            cursor.execute(
+                'INSERT INTO recipes_recipe_fts '
+                '(rowid, name, text, ingredients) '
+                'SELECT recipe.id, recipe.name, recipe.text, '
+                f"coalesce(({names}), '') FROM recipes_recipe recipe"
+            )
+
+
+def drop_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('DROP INDEX IF EXISTS recipe_search_vector_idx')
+        elif connection.vendor == 'sqlite':
+            cursor.execute('DROP TABLE IF EXISTS recipes_recipe_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_reciperanking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True, verbose_name='Поисковый вектор'
+            ),
+        ),
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeActivity',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID'
+                    )
+                ),
+                (
+                    'kind',
+                    models.CharField(
+                        choices=[
+                            ('favorited', 'Избранное'),
+                            ('in_shopping_cart', 'Корзина покупок'),
+                        ],
+                        max_length=16,
+                        verbose_name='Тип'
+                    )
+                ),
+                (
+                    'created_at',
+                    models.DateTimeField(
+                        auto_now_add=True, db_index=True, verbose_name='Дата'
+                    )
+                ),
+                (
+                    'recipe',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='activities',
+                        to='recipes.recipe',
+                        verbose_name='Рецепт'
+                    )
+                ),
+            ],
+            options={
+                'verbose_name': 'Активность по рецепту',
+                'verbose_name_plural': 'Активность по рецептам',
+            },
+        ),
+    ]
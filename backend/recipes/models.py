@@ -1,7 +1,9 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models.functions import RowNumber
 
 from foodgram_backend.settings import MAX_VALUE, MIN_VALUE
 
@@ -9,6 +11,39 @@ from foodgram_backend.settings import MAX_VALUE, MIN_VALUE
 User = get_user_model()
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def for_reading(self):
+        return self.select_related('author').prefetch_related(
+            'tags',
+            models.Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+        )
+
+    def limited_per_author(self, author_ids, limit=None):
+        queryset = self.filter(author_id__in=author_ids)
+        if limit is None:
+            return queryset
+        # ROW_NUMBER() нельзя фильтровать в ORM Django 3.2, поэтому
+        # ранжированный запрос оборачивается во внешний SELECT
+        sql, params = queryset.annotate(
+            row_number=models.Window(
+                expression=RowNumber(),
+                partition_by=models.F('author_id'),
+                order_by=(
+                    models.F('created_at').desc(), models.F('id').desc()
+                ),
+            )
+        ).query.sql_with_params()
+        return self.model.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE row_number <= %s '
+            'ORDER BY row_number',
+            (*params, limit)
+        )
+
+
 class Recipe(models.Model):
     name = models.CharField(max_length=100, verbose_name='Название')
     ingredients = models.ManyToManyField(
@@ -25,9 +60,18 @@ class Recipe(models.Model):
     is_in_shopping_cart = models.ManyToManyField(
         User, related_name='recipes_in_cart', verbose_name='В корзине'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Добавлено в избранное'
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Добавлено в корзину'
+    )
     image = models.ImageField(
         upload_to='recipes/images/', verbose_name='Изображение'
     )
+    image_variants = models.JSONField(
+        default=dict, editable=False, verbose_name='Уменьшенные копии'
+    )
     cooking_time = models.IntegerField(
         validators=[
             MinValueValidator(MIN_VALUE),
@@ -48,11 +92,24 @@ class Recipe(models.Model):
     updated_at = models.DateTimeField(
         auto_now=True, verbose_name='Дата обновления'
     )
+    search_vector = SearchVectorField(
+        null=True, editable=False, verbose_name='Поисковый вектор'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('name',)
+        # Индекс по дате — для ?ordering=new и курсорной пагинации,
+        # по названию — для сортировки по умолчанию
+        indexes = (
+            models.Index(
+                fields=('created_at', 'id'), name='recipe_created_at_idx'
+            ),
+            models.Index(fields=('name',), name='recipe_name_idx'),
+        )
 
     def __str__(self):
         return self.name
@@ -70,6 +127,12 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ('name',)
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient',
+            ),
+        )
 
     def __str__(self):
         return f'{self.name} - {self.measurement_unit}'
@@ -95,7 +158,13 @@ class RecipeIngredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент рецепта'
         verbose_name_plural = 'Ингредиенты рецепта'
-        ordering = ('recipe',)
+        ordering = ('id',)
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                name='unique_recipe_ingredient',
+            ),
+        )
 
     def __str__(self):
         return f'{self.recipe} - {self.ingredient}'
@@ -108,7 +177,9 @@ class Tag(models.Model):
     color = models.CharField(
         max_length=settings.CHAR_NAME, verbose_name='Цвет'
     )
-    slug = models.SlugField(max_length=settings.CHAR_NAME, verbose_name='Слаг')
+    slug = models.SlugField(
+        max_length=settings.CHAR_NAME, unique=True, verbose_name='Слаг'
+    )
 
     class Meta:
         verbose_name = 'Тег'
@@ -131,6 +202,64 @@ class RecipeTag(models.Model):
         verbose_name = 'Тег рецепта'
         verbose_name_plural = 'Теги рецепта'
         ordering = ('tag',)
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'tag'), name='unique_recipe_tag'
+            ),
+        )
 
     def __str__(self):
         return f'{self.recipe} - {self.tag}'
+
+
+class RecipeRanking(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ranking',
+        verbose_name='Рецепт'
+    )
+    popularity = models.FloatField(
+        default=0, db_index=True, verbose_name='Популярность'
+    )
+    trending = models.FloatField(
+        default=0, db_index=True, verbose_name='Тренд'
+    )
+    refreshed_at = models.DateTimeField(verbose_name='Дата пересчёта')
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+
+    def __str__(self):
+        return f'{self.recipe_id} - {self.popularity}'
+
+
+class RecipeActivity(models.Model):
+    # Добавления в избранное и корзину с датой: тренды считаются по ним
+    # за последние дни, а не по возрасту рецепта
+    FAVORITED = 'favorited'
+    IN_SHOPPING_CART = 'in_shopping_cart'
+    KINDS = (
+        (FAVORITED, 'Избранное'),
+        (IN_SHOPPING_CART, 'Корзина покупок'),
+    )
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='activities',
+        verbose_name='Рецепт'
+    )
+    kind = models.CharField(max_length=16, choices=KINDS, verbose_name='Тип')
+    created_at = models.DateTimeField(
+        auto_now_add=True, db_index=True, verbose_name='Дата'
+    )
+
+    class Meta:
+        verbose_name = 'Активность по рецепту'
+        verbose_name_plural = 'Активность по рецептам'
+
+    def __str__(self):
+        return f'{self.recipe_id} - {self.kind}'
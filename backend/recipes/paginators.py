@@ -1,7 +1,13 @@
+from collections import OrderedDict
+import json
+
+from django.db import connection
 from rest_framework.pagination import (
+    CursorPagination,
     LimitOffsetPagination,
     PageNumberPagination,
 )
+from rest_framework.response import Response
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -15,3 +21,41 @@ class Pagination(LimitOffsetPagination):
     default_limit = 10
     limit_query_param = 'limit'
     max_limit = 100
+
+
+def approximate_count(queryset):
+    # Оценка числа строк из плана запроса вместо COUNT(*)
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class RecipeCursorPagination(CursorPagination):
+    cursor_query_param = 'cursor'
+    page_size = 10
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'approx':
+            self.count = approximate_count(queryset.order_by())
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = [
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]
+        if self.count is not None:
+            response.insert(0, ('count', self.count))
+        return Response(OrderedDict(response))
@@ -0,0 +1,90 @@
+import csv
+
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer
+
+from recipes.utils import PDF
+
+
+class Echo:
+    # Псевдобуфер для csv.writer: возвращает строку вместо записи
+
+    def write(self, value):
+        return value
+
+
+def format_line(ingredient):
+    return (
+        f'{ingredient["ingredient__name"]} '
+        f'({ingredient["ingredient__measurement_unit"]}) — '
+        f'{ingredient["total_quantity"]}'
+    )
+
+
+class ShoppingListNegotiation(DefaultContentNegotiation):
+    # Список покупок раньше отдавался PDF на любой Accept: если клиент
+    # не принимает ни один формат файла, отдаётся первый (PDF), а не 406
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            return renderers[0], renderers[0].media_type
+
+
+class ShoppingListRenderer(BaseRenderer):
+    charset = 'utf-8'
+    streaming = True
+
+    @property
+    def content_type(self):
+        if self.charset:
+            return f'{self.media_type}; charset={self.charset}'
+        return self.media_type
+
+    @property
+    def filename(self):
+        return f'shopping_cart.{self.format}'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b''.join(self.stream(data))
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        for ingredient in ingredients:
+            yield f'{format_line(ingredient)}\n'.encode(self.charset)
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('Ингредиент', 'Единица измерения', 'Количество')
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.header).encode(self.charset)
+        for ingredient in ingredients:
+            yield writer.writerow((
+                ingredient['ingredient__name'],
+                ingredient['ingredient__measurement_unit'],
+                ingredient['total_quantity'],
+            )).encode(self.charset)
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    streaming = False
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        pdf = PDF()
+        text = '\n'.join(format_line(ingredient) for ingredient in data)
+        pdf.print_chapter('Список покупок:', text)
+        # FPDF хранит документ строкой в latin-1
+        return pdf.output(dest='S').encode('latin-1')
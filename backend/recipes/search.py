@@ -0,0 +1,311 @@
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from datetime import timedelta
+import heapq
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+from recipes.cache import (
+    DELETED_RECIPES_CACHE,
+    INGREDIENTS_CACHE,
+    RECIPES_CACHE,
+    get_version,
+)
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+# bm25 в SQLite считается по всем совпадениям, поэтому ранжируется
+# ограниченное число лучших кандидатов
+FTS_CANDIDATES = 1000
+FTS_BATCH_SIZE = 500
+# Ингредиенты рецепта записываются после save(), поэтому при
+# дозагрузке изменённые рецепты берутся с запасом по времени
+MATCH_SYNC_OVERLAP = timedelta(minutes=1)
+# Списки рецептов по ингредиенту: знаковые 64-битные числа, как у
+# BigAutoField ('I' — 32 бита без знака — переполняется на id >= 2**32)
+POSTINGS_TYPECODE = 'q'
+
+
+class IngredientIndex:
+    # Отсортированные списки названий и отдельных слов в названиях.
+    # Префиксный поиск — бинарный поиск и проход по совпадающему отрезку.
+
+    def __init__(self):
+        self.version = None
+        self.names = []
+        self.words = []
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        version = get_version(INGREDIENTS_CACHE)
+        if version == self.version:
+            return
+        with self.lock:
+            if version == self.version:
+                return
+            names = sorted(
+                (name.casefold(), pk)
+                for pk, name in Ingredient.objects.values_list('id', 'name')
+            )
+            words = sorted(
+                (word, name, pk)
+                for name, pk in names
+                for word in name.split()[1:]
+            )
+            self.names, self.words, self.version = names, words, version
+
+    def search(self, query, limit):
+        self.refresh()
+        query = query.strip().casefold()
+        names, words = self.names, self.words
+        result = []
+
+        position = bisect_left(names, (query,))
+        while (
+            len(result) < limit and position < len(names)
+            and names[position][0].startswith(query)
+        ):
+            result.append(names[position][1])
+            position += 1
+
+        found = set(result)
+        position = bisect_left(words, (query,))
+        while (
+            len(result) < limit and position < len(words)
+            and words[position][0].startswith(query)
+        ):
+            pk = words[position][2]
+            if pk not in found:
+                found.add(pk)
+                result.append(pk)
+            position += 1
+
+        return result
+
+
+class RecipeMatchIndex:
+    # Обратный индекс ингредиент -> отсортированный массив id рецептов
+    # и состав каждого рецепта. Сохранённые рецепты дозагружаются по
+    # updated_at, после удаления и по истечении TTL индекс строится заново
+    # в фоне, а до замены запросы читают прежний индекс. Версии берутся из
+    # кэша Django: изменения из других воркеров видны только при общем
+    # CACHE_BACKEND, с LocMemCache — лишь по истечении TTL.
+
+    def __init__(self):
+        self.version = None
+        self.deleted_version = None
+        self.built_at = 0
+        self.synced_at = None
+        self.rebuilding = False
+        # (postings, recipes) заменяются целиком, чтобы чтение без
+        # блокировки видело согласованную пару
+        self.state = ({}, {})
+        self.lock = threading.Lock()
+
+    def is_expired(self):
+        return (
+            time.monotonic() - self.built_at > settings.RECIPE_MATCH_INDEX_TTL
+        )
+
+    def refresh(self):
+        version = get_version(RECIPES_CACHE)
+        deleted_version = get_version(DELETED_RECIPES_CACHE)
+        if (
+            version == self.version and deleted_version == self.deleted_version
+            and not self.is_expired()
+        ):
+            return
+        with self.lock:
+            if self.rebuilding:
+                return
+            if not self.built_at:
+                # Первое построение: отдать пока нечего
+                self.rebuild()
+            elif self.is_expired() or deleted_version != self.deleted_version:
+                self.rebuilding = True
+                threading.Thread(
+                    target=self.rebuild_in_background,
+                    args=(version, deleted_version),
+                    daemon=True,
+                ).start()
+                return
+            elif version != self.version:
+                self.update()
+            self.version, self.deleted_version = version, deleted_version
+
+    def rebuild_in_background(self, version, deleted_version):
+        try:
+            self.rebuild()
+            self.version, self.deleted_version = version, deleted_version
+        except Exception:
+            logger.exception('Не удалось перестроить индекс рецептов')
+        finally:
+            self.rebuilding = False
+            connections.close_all()
+
+    def rebuild(self):
+        synced_at = timezone.now()
+        postings = {}
+        recipes = {}
+        rows = RecipeIngredient.objects.order_by(
+            'ingredient_id', 'recipe_id'
+        ).values_list('ingredient_id', 'recipe_id')
+        for ingredient_id, recipe_id in rows.iterator(chunk_size=10_000):
+            if ingredient_id not in postings:
+                postings[ingredient_id] = array(POSTINGS_TYPECODE)
+            postings[ingredient_id].append(recipe_id)
+            recipes.setdefault(recipe_id, []).append(ingredient_id)
+        self.state = (
+            postings, {pk: tuple(items) for pk, items in recipes.items()}
+        )
+        self.built_at = time.monotonic()
+        self.synced_at = synced_at
+
+    def update(self):
+        synced_at = timezone.now()
+        changed = {}
+        rows = RecipeIngredient.objects.filter(
+            recipe__updated_at__gte=self.synced_at - MATCH_SYNC_OVERLAP
+        ).order_by().values_list('recipe_id', 'ingredient_id')
+        for recipe_id, ingredient_id in rows:
+            changed.setdefault(recipe_id, []).append(ingredient_id)
+
+        affected = set()
+        postings, recipes = self.state
+        postings, recipes = dict(postings), dict(recipes)
+        for recipe_id, ingredient_ids in changed.items():
+            affected.update(recipes.get(recipe_id, ()))
+            affected.update(ingredient_ids)
+            recipes[recipe_id] = tuple(ingredient_ids)
+
+        for ingredient_id in affected:
+            recipe_ids = set(postings.get(ingredient_id, ())) - changed.keys()
+            recipe_ids.update(
+                recipe_id for recipe_id, ingredient_ids in changed.items()
+                if ingredient_id in ingredient_ids
+            )
+            postings[ingredient_id] = array(
+                POSTINGS_TYPECODE, sorted(recipe_ids)
+            )
+        self.state = (postings, recipes)
+        self.synced_at = synced_at
+
+    def match(self, ingredient_ids, limit):
+        # Возвращает до limit кортежей (покрытие, совпало, id рецепта),
+        # покрытие — доля ингредиентов рецепта из ingredient_ids
+        self.refresh()
+        postings, recipes = self.state
+        hits = Counter()
+        for ingredient_id in set(ingredient_ids):
+            hits.update(postings.get(ingredient_id, ()))
+        return heapq.nlargest(
+            limit,
+            (
+                (count / len(recipes[recipe_id]), count, recipe_id)
+                for recipe_id, count in hits.items()
+            ),
+        )
+
+
+ingredient_index = IngredientIndex()
+recipe_match_index = RecipeMatchIndex()
+
+
+def ingredient_names_sql(aggregate):
+    return (
+        f'SELECT {aggregate} FROM {RecipeIngredient._meta.db_table} ri '
+        f'JOIN {Ingredient._meta.db_table} i ON i.id = ri.ingredient_id '
+        'WHERE ri.recipe_id = recipe.id'
+    )
+
+
+def index_recipes(ids=None, using='default'):
+    # Пересчитывает поисковый индекс для рецептов ids (None — для всех)
+    # одним запросом на стороне базы: название весит больше описания,
+    # описание — больше ингредиентов
+    connection = connections[using]
+    recipe_table = Recipe._meta.db_table
+    if ids is not None:
+        ids = list(ids)
+        if not ids:
+            return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            names = ingredient_names_sql("string_agg(i.name, ' ')")
+            sql = (
+                f'UPDATE {recipe_table} AS recipe SET search_vector = '
+                "setweight(to_tsvector(%s::regconfig, recipe.name), 'A') || "
+                "setweight(to_tsvector(%s::regconfig, recipe.text), 'B') || "
+                'setweight(to_tsvector(%s::regconfig, '
+                f"coalesce(({names}), '')), 'C')"
+            )
+            params = [SEARCH_CONFIG] * 3
+            if ids is not None:
+                sql += ' WHERE recipe.id = ANY(%s)'
+                params.append(ids)
+            cursor.execute(sql, params)
+        elif connection.vendor == 'sqlite':
+            names = ingredient_names_sql("group_concat(i.name, ' ')")
+            sql = (
+                f'INSERT INTO {FTS_TABLE} (rowid, name, text, ingredients) '
+                'SELECT recipe.id, recipe.name, recipe.text, '
+                f"coalesce(({names}), '') FROM {recipe_table} recipe"
+            )
+            if ids is None:
+                cursor.execute(f'DELETE FROM {FTS_TABLE}')
+                cursor.execute(sql)
+                return
+            for start in range(0, len(ids), FTS_BATCH_SIZE):
+                batch = ids[start:start + FTS_BATCH_SIZE]
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(
+                    f'DELETE FROM {FTS_TABLE} '
+                    f'WHERE rowid IN ({placeholders})',
+                    batch,
+                )
+                cursor.execute(
+                    f'{sql} WHERE recipe.id IN ({placeholders})', batch
+                )
+
+
+def search_recipes(queryset, query):
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-rank', '-created_at', '-id')
+
+    if connection.vendor != 'sqlite':
+        return queryset.filter(name__icontains=query)
+
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return queryset.none()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY bm25({FTS_TABLE}, 10.0, 5.0, 1.0) LIMIT %s',
+            [' '.join(f'"{term}"*' for term in terms), FTS_CANDIDATES],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+    if not ids:
+        return queryset.none()
+    return queryset.filter(pk__in=ids).order_by(
+        Case(*[When(pk=pk, then=rank) for rank, pk in enumerate(ids)])
+    )
@@ -1,53 +1,190 @@
 import base64
-import imghdr
-import uuid
+import hashlib
+from tempfile import SpooledTemporaryFile
 
+from PIL import Image
 from django.conf import settings
-from django.core.files.base import ContentFile
+from django.core.files import File
+from django.core.files.storage import default_storage
 from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import transaction
+from django.db.models import BigIntegerField
 from rest_framework import serializers
 import six
 
 from recipes.models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
+from recipes.thumbnails import save_once, touch
+from users.relations import get_relations
 from users.serializers import UserListSerializer
 
 
-FILE_NAME_LENGTH = settings.FILE_NAME_LENGTH
 MIN_VALUE = settings.MIN_VALUE
 MAX_VALUE = settings.MAX_VALUE
+IMAGE_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+IMAGE_SIGNATURES = (
+    b'\xff\xd8\xff',
+    b'\x89PNG\r\n\x1a\n',
+    b'GIF87a',
+    b'GIF89a',
+    b'RIFF',
+)
+BASE64_CHUNK_SIZE = 64 * 1024
 
 
 class Base64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'image_too_large': (
+            'Размер изображения не должен превышать {max_size} байт.'
+        ),
+        'too_many_pixels': (
+            'Изображение не должно содержать больше {max_pixels} пикселей.'
+        ),
+    }
 
     def to_internal_value(self, data):
-        if isinstance(data, six.string_types):
-            if 'data:' in data and ';base64,' in data:
-                header, data = data.split(';base64,')
-
+        if not isinstance(data, six.string_types):
+            return super(Base64ImageField, self).to_internal_value(data)
+
+        start = 0
+        if 'data:' in data and ';base64,' in data:
+            start = data.index(';base64,') + len(';base64,')
+        # Размер декодированных данных известен заранее с точностью
+        # до пробелов и выравнивания, поэтому проверяется до декодирования
+        if (len(data) - start) // 4 * 3 > settings.MAX_IMAGE_SIZE:
+            self.fail('image_too_large', max_size=settings.MAX_IMAGE_SIZE)
+
+        file = SpooledTemporaryFile(max_size=settings.IMAGE_SPOOL_SIZE)
+        try:
+            image_format, digest = self.decode(data, start, file)
+        except Exception:
+            file.close()
+            raise
+
+        # Имя файла — хэш содержимого: одинаковые изображения (в том числе
+        # повторно присланные при редактировании) хранятся одним файлом
+        complete_file_name = '%s.%s' % (
+            digest,
+            IMAGE_EXTENSIONS[image_format],
+        )
+        field = Recipe._meta.get_field('image')
+        name = field.generate_filename(None, complete_file_name)
+        # Изображение уже проверено в decode(), поэтому файл сохраняется
+        # сразу, без повторного чтения в ImageField.to_internal_value
+        try:
+            if touch(field.storage, name):
+                return name
+            file.seek(0)
+            return save_once(field.storage, name, File(file))
+        finally:
+            file.close()
+
+    def decode(self, data, start, file):
+        # Декодирует base64 частями во временный файл и проверяет формат
+        # и размеры по заголовку, как только он получен целиком
+        image_format = None
+        digest = hashlib.sha256()
+        rest = ''
+        for position in range(start, len(data), BASE64_CHUNK_SIZE):
+            chunk = rest + ''.join(
+                data[position:position + BASE64_CHUNK_SIZE].split()
+            )
+            usable = len(chunk) - len(chunk) % 4
             try:
-                decoded_file = base64.b64decode(data)
-            except TypeError:
+                decoded = base64.b64decode(chunk[:usable])
+            except (TypeError, ValueError):
                 self.fail('invalid_image')
+            file.write(decoded)
+            digest.update(decoded)
+            rest = chunk[usable:]
 
-            file_name = str(uuid.uuid4())[:FILE_NAME_LENGTH]
-            file_extension = self.get_file_extension(file_name, decoded_file)
-            complete_file_name = '%s.%s' % (
-                file_name,
-                file_extension,
+            if file.tell() > settings.MAX_IMAGE_SIZE:
+                self.fail(
+                    'image_too_large', max_size=settings.MAX_IMAGE_SIZE
+                )
+            if image_format is None:
+                image_format = self.read_header(file)
+
+        if rest:
+            self.fail('invalid_image')
+        if image_format is None:
+            self.fail('invalid_image')
+
+        size = file.tell()
+        file.seek(0)
+        try:
+            Image.open(file).verify()
+        except Exception:
+            self.fail('invalid_image')
+        file.seek(size)
+        return image_format, digest.hexdigest()
+
+    def read_header(self, file):
+        # None, если заголовок ещё не дочитан
+        size = file.tell()
+        file.seek(0)
+        head = file.read(len(max(IMAGE_SIGNATURES, key=len)))
+        if len(head) >= 12 and not any(
+            head.startswith(signature) for signature in IMAGE_SIGNATURES
+        ):
+            self.fail('invalid_image')
+
+        file.seek(0)
+        try:
+            image = Image.open(file)
+        except Image.DecompressionBombError:
+            self.fail(
+                'too_many_pixels', max_pixels=settings.MAX_IMAGE_PIXELS
             )
-
-            data = ContentFile(decoded_file, name=complete_file_name)
-
-        return super(Base64ImageField, self).to_internal_value(data)
-
-    def get_file_extension(self, file_name, decoded_file):
-        extension = imghdr.what(file_name, decoded_file)
-
-        return 'jpg' if extension == 'jpeg' else extension
+        except OSError:
+            return None
+        finally:
+            file.seek(size)
+
+        if image.format not in IMAGE_EXTENSIONS:
+            self.fail('invalid_image')
+        width, height = image.size
+        if width * height > settings.MAX_IMAGE_PIXELS:
+            self.fail(
+                'too_many_pixels', max_pixels=settings.MAX_IMAGE_PIXELS
+            )
+        return image.format
+
+
+class ImageVariantsField(serializers.Field):
+    # Ссылки на уменьшенные копии изображения рецепта; пока копии
+    # не готовы, отдаётся оригинал
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return None
+        variants = recipe.image_variants
+        if variants.get('source') != recipe.image.name:
+            variants = {}
+        request = self.context.get('request')
+        urls = {}
+        for variant in settings.IMAGE_VARIANTS:
+            url = (
+                default_storage.url(variants[variant])
+                if variant in variants else recipe.image.url
+            )
+            urls[variant] = (
+                request.build_absolute_uri(url) if request else url
+            )
+        return urls
 
 
 class RecipeIngredientWriteSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(
         validators=[
             MinValueValidator(MIN_VALUE),
@@ -103,22 +240,31 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     tags = TagReadSerializer(many=True, read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField()
     cooking_time = serializers.IntegerField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'name', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'image', 'cooking_time', 'text'
+            'is_in_shopping_cart', 'image', 'image_variants', 'cooking_time',
+            'text'
         )
 
     def get_is_favorited(self, obj):
-        user = self.context['request'].user
-        return obj.is_favorited.filter(id=user.id).exists()
+        return obj.id in get_relations(self.context['request']).favorited
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context['request'].user
-        return obj.is_in_shopping_cart.filter(id=user.id).exists()
+        return obj.id in get_relations(
+            self.context['request']
+        ).in_shopping_cart
+
+
+class RecipeMatchSerializer(RecipeReadSerializer):
+    coverage = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + ('coverage',)
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
@@ -142,38 +288,76 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         )
         model = Recipe
 
-    def create_ingredients(self, model_object, ingredients, recipe):
-        model_object.objects.bulk_create(
+    def create_ingredients(self, recipe, ingredients):
+        RecipeIngredient.objects.bulk_create(
             [
-                model_object(
+                RecipeIngredient(
                     recipe=recipe,
-                    ingredient=ingredient['id'],
+                    ingredient_id=ingredient['id'],
                     quantity=ingredient['quantity'],
                 ) for ingredient in ingredients
             ]
         )
 
-    def create_tags(self, model_object, tags, recipe):
-        model_object.objects.bulk_create(
+    def create_tags(self, recipe, tag_ids):
+        RecipeTag.objects.bulk_create(
+            [RecipeTag(recipe=recipe, tag_id=tag_id) for tag_id in tag_ids]
+        )
+
+    def update_ingredients(self, recipe, ingredients):
+        quantities = {
+            ingredient['id']: ingredient['quantity']
+            for ingredient in ingredients
+        }
+        existing = {
+            row.ingredient_id: row for row in recipe.recipeingredient_set.all()
+        }
+
+        RecipeIngredient.objects.filter(recipe=recipe).exclude(
+            ingredient_id__in=quantities
+        ).delete()
+
+        changed = []
+        for ingredient_id, row in existing.items():
+            quantity = quantities.get(ingredient_id)
+            if quantity is not None and row.quantity != quantity:
+                row.quantity = quantity
+                changed.append(row)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['quantity'])
+
+        self.create_ingredients(
+            recipe,
             [
-                model_object(
-                    recipe=recipe,
-                    tag=Tag.objects.get(id=tag),
-                ) for tag in tags
+                ingredient for ingredient in ingredients
+                if ingredient['id'] not in existing
             ]
         )
 
+    def update_tags(self, recipe, tag_ids):
+        existing = set(
+            recipe.recipetag_set.order_by().values_list('tag_id', flat=True)
+        )
+        RecipeTag.objects.filter(recipe=recipe).exclude(
+            tag_id__in=tag_ids
+        ).delete()
+        self.create_tags(
+            recipe, [tag_id for tag_id in tag_ids if tag_id not in existing]
+        )
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
 
-        self.create_ingredients(RecipeIngredient, ingredients, recipe)
+        self.create_ingredients(recipe, ingredients)
 
-        self.create_tags(RecipeTag, tags, recipe)
+        self.create_tags(recipe, tags)
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         if 'ingredients' not in validated_data:
             raise serializers.ValidationError(
@@ -191,21 +375,14 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
         instance.save()
 
-        instance.recipeingredient_set.all().delete()
-        self.create_ingredients(RecipeIngredient, ingredients, instance)
-        for ingredient in ingredients:
-            RecipeIngredient.objects.create(
-                recipe=instance,
-                ingredient=ingredient['id'],
-                quantity=ingredient['quantity'],
-            )
+        self.update_ingredients(instance, ingredients)
 
-        instance.tags.clear()
-        self.create_tags(RecipeTag, tags_data, instance)
+        self.update_tags(instance, tags_data)
 
         return instance
 
     def to_representation(self, instance):
+        instance = Recipe.objects.for_reading().get(pk=instance.pk)
         serializer = RecipeReadSerializer(instance, context=self.context)
         return serializer.data
 
@@ -220,11 +397,21 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                 'Список ингредиентов не может быть пустым.'
             )
 
-        ingredient_ids = [ingredient['id'].id for ingredient in ingredients]
+        ingredient_ids = [ingredient['id'] for ingredient in ingredients]
         if len(ingredient_ids) != len(set(ingredient_ids)):
             raise serializers.ValidationError(
                 'Ингредиенты не должны повторяться.'
             )
+
+        missing = set(ingredient_ids) - set(
+            Ingredient.objects.filter(
+                id__in=ingredient_ids
+            ).order_by().values_list('id', flat=True)
+        )
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиент с id {min(missing)} не существует.'
+            )
         return ingredients
 
     def validate_tags(self, tag_ids):
@@ -233,20 +420,39 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                 'Список тэгов не должен быть пустым.'
             )
 
-        for tag_id in tag_ids:
-            if not Tag.objects.filter(id=tag_id).exists():
-                raise serializers.ValidationError(
-                    f'Тег с id {tag_id} не существует.'
-                )
-
         if len(tag_ids) != len(set(tag_ids)):
             raise serializers.ValidationError('Тэги не должны повторяться.')
 
+        missing = set(tag_ids) - set(
+            Tag.objects.filter(
+                id__in=tag_ids
+            ).order_by().values_list('id', flat=True)
+        )
+        if missing:
+            raise serializers.ValidationError(
+                f'Тег с id {min(missing)} не существует.'
+            )
+
         return tag_ids
 
 
 class SimpleRecipeSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        # Граница BigAutoField: большие id дали бы ошибку базы, а не 400
+        child=serializers.IntegerField(
+            min_value=1, max_value=BigIntegerField.MAX_BIGINT
+        ),
+        allow_empty=False,
+        max_length=settings.RECIPE_BATCH_SIZE,
+    )
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
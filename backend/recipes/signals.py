@@ -0,0 +1,160 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes.activity import activity_recorder
+from recipes.cache import (
+    DELETED_RECIPES_CACHE,
+    INGREDIENTS_CACHE,
+    RECIPES_CACHE,
+    TAGS_CACHE,
+    bump_version,
+)
+from recipes.counters import change_counter, m2m_counter
+from recipes.models import (
+    Ingredient,
+    Recipe,
+    RecipeActivity,
+    RecipeIngredient,
+    Tag,
+    User,
+)
+from recipes.search import index_recipes
+from recipes.thumbnails import schedule_variants
+from users.relations import relations_invalidator
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    bump_version(TAGS_CACHE)
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    bump_version(INGREDIENTS_CACHE)
+
+
+def touch_recipes(recipes):
+    # Тег и ингредиент выводятся внутри рецепта: сдвиг updated_at меняет
+    # ETag и Last-Modified затронутых рецептов
+    recipes.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_tag_recipes(sender, instance, created=False, **kwargs):
+    if not created:
+        touch_recipes(Recipe.objects.filter(tags=instance))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def touch_ingredient_recipes(sender, instance, created=False, **kwargs):
+    if not created:
+        touch_recipes(Recipe.objects.filter(ingredients=instance))
+
+
+for through, field_name, counter_field, kind in (
+    (
+        Recipe.is_favorited.through, 'is_favorited',
+        'favorites_count', 'favorited'
+    ),
+    (
+        Recipe.is_in_shopping_cart.through, 'is_in_shopping_cart',
+        'shopping_cart_count', 'in_shopping_cart'
+    ),
+    (
+        User.subscribers.through, 'subscribers',
+        'subscribers_count', 'subscriptions'
+    ),
+):
+    m2m_changed.connect(
+        m2m_counter(field_name, counter_field), sender=through, weak=False
+    )
+    m2m_changed.connect(
+        relations_invalidator(field_name, kind), sender=through, weak=False
+    )
+
+for through, kind in (
+    (Recipe.is_favorited.through, RecipeActivity.FAVORITED),
+    (Recipe.is_in_shopping_cart.through, RecipeActivity.IN_SHOPPING_CART),
+):
+    m2m_changed.connect(activity_recorder(kind), sender=through, weak=False)
+
+
+@receiver(post_save, sender=Recipe)
+def count_created_recipe(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', 1
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(sender, instance, **kwargs):
+    change_counter(
+        User.objects.filter(pk=instance.author_id), 'recipes_count', -1
+    )
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def reindex_recipe(sender, instance, **kwargs):
+    # Ингредиенты рецепта записываются после save(), поэтому индекс
+    # обновляется после коммита
+    transaction.on_commit(partial(index_recipes, [instance.pk]))
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_saved_recipe(sender, **kwargs):
+    transaction.on_commit(partial(bump_version, RECIPES_CACHE))
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_deleted_recipe(sender, **kwargs):
+    transaction.on_commit(partial(bump_version, DELETED_RECIPES_CACHE))
+
+
+@receiver(post_save, sender=Recipe)
+def build_image_variants(sender, instance, **kwargs):
+    if (
+        instance.image
+        and instance.image_variants.get('source') != instance.image.name
+    ):
+        transaction.on_commit(
+            partial(schedule_variants, instance.pk, instance.image.name)
+        )
+
+
+@receiver(post_save, sender=Ingredient)
+def reindex_ingredient_recipes(sender, instance, created, **kwargs):
+    if not created:
+        transaction.on_commit(partial(
+            index_recipes,
+            RecipeIngredient.objects.filter(
+                ingredient=instance
+            ).values_list('recipe_id', flat=True).distinct(),
+        ))
+
+
+@receiver(pre_delete, sender=User)
+def count_deleted_user_relations(sender, instance, **kwargs):
+    # Каскадное удаление связей не отправляет m2m_changed
+    change_counter(
+        Recipe.objects.filter(is_favorited=instance), 'favorites_count', -1
+    )
+    change_counter(
+        Recipe.objects.filter(is_in_shopping_cart=instance),
+        'shopping_cart_count',
+        -1,
+    )
+    change_counter(
+        User.objects.filter(subscribers=instance), 'subscribers_count', -1
+    )
@@ -0,0 +1,532 @@
+import base64
+from datetime import timedelta
+from io import BytesIO, StringIO
+import re
+import shutil
+import tempfile
+
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from recipes.models import (
+    Ingredient,
+    Recipe,
+    RecipeActivity,
+    RecipeIngredient,
+    RecipeRanking,
+    Tag,
+)
+from recipes.search import RecipeMatchIndex
+from recipes.utils import get_shopping_list
+
+
+User = get_user_model()
+
+RECIPES_URL = '/api/recipes/'
+MEDIA_ROOT = tempfile.mkdtemp()
+# Строки плана с чтением всей таблицы: SQLite пишет «SCAN table» без
+# «USING ... INDEX», PostgreSQL — «Seq Scan on table»
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (\w+)\b(?! USING)'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+}
+# Обход всего индекса без условия поиска: допустим только там, где индекс
+# отдаёт строки в нужном порядке и запрос ограничен LIMIT
+INDEX_WALK_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (\w+) USING (?:COVERING )?INDEX'),
+}
+
+
+def make_image():
+    buffer = BytesIO()
+    Image.new('RGB', (2, 2), 'white').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+class RecipeListTestCase(APITestCase):
+    # Автор, читатель с отношениями к рецептам, теги и ингредиенты
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {i}', color='#000000', slug=f'tag-{i}'
+            ) for i in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            ) for i in range(10)
+        ]
+
+    def create_recipe(self, ingredients=3):
+        recipe = Recipe.objects.create(
+            name='Рецепт',
+            image='recipes/images/recipe.jpg',
+            cooking_time=10,
+            text='Описание',
+            author=self.author,
+        )
+        recipe.tags.set(self.tags)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, quantity=1)
+            for ingredient in self.ingredients[:ingredients]
+        )
+        recipe.is_favorited.add(self.reader)
+        recipe.is_in_shopping_cart.add(self.reader)
+        self.author.subscribers.add(self.reader)
+        return recipe
+
+    def create_recipes(self, count):
+        for _ in range(count):
+            self.create_recipe()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+
+class RecipeQueryCountTest(RecipeListTestCase):
+    # Число запросов к списку и рецепту не должно зависеть
+    # от количества рецептов на странице
+
+    def assert_constant_queries(self, url, count):
+        self.create_recipes(count)
+        expected = self.count_queries(url)
+        self.create_recipes(count)
+        with self.assertNumQueries(expected):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), count * 2)
+
+    def test_list_anonymous(self):
+        self.assert_constant_queries(f'{RECIPES_URL}?limit=100', 3)
+
+    def test_list_authenticated(self):
+        self.client.force_authenticate(self.reader)
+        self.assert_constant_queries(f'{RECIPES_URL}?limit=100', 3)
+
+    def test_retrieve(self):
+        self.client.force_authenticate(self.reader)
+        small = self.create_recipe(ingredients=1)
+        large = self.create_recipe(ingredients=10)
+        expected = self.count_queries(f'{RECIPES_URL}{small.id}/')
+        with self.assertNumQueries(expected):
+            response = self.client.get(f'{RECIPES_URL}{large.id}/')
+        self.assertEqual(len(response.data['ingredients']), 10)
+
+
+class ConditionalRecipeTest(RecipeListTestCase):
+    # Ответ 304 проверяется без загрузки тегов и ингредиентов,
+    # а ETag учитывает данные автора
+
+    def revalidate(self, url):
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([
+            query for query in context.captured_queries
+            if 'recipes_recipeingredient' in query['sql']
+            or 'recipes_recipetag' in query['sql']
+        ])
+        return etag
+
+    def test_list_not_modified(self):
+        self.client.force_authenticate(self.reader)
+        self.create_recipes(3)
+        self.revalidate(RECIPES_URL)
+
+    def test_retrieve_not_modified(self):
+        recipe = self.create_recipe()
+        self.revalidate(f'{RECIPES_URL}{recipe.id}/')
+
+    def test_author_change(self):
+        recipe = self.create_recipe()
+        for url in (RECIPES_URL, f'{RECIPES_URL}{recipe.id}/'):
+            etag = self.client.get(url)['ETag']
+            User.objects.filter(pk=self.author.pk).update(
+                first_name=f'Имя {url}'
+            )
+            self.assertEqual(
+                self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+                200,
+            )
+
+
+class RecipeQueryPlanTest(APITestCase):
+    # Частые запросы ленты, фильтров и корзины должны читать таблицы
+    # по индексам. На тестовых объёмах PostgreSQL предпочёл бы Seq Scan,
+    # поэтому он отключается на время проверки
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass'
+        )
+        tag = Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        ingredient = Ingredient.objects.create(
+            name='Ингредиент', measurement_unit='г'
+        )
+        for _ in range(3):
+            recipe = Recipe.objects.create(
+                name='Рецепт',
+                image='recipes/images/recipe.jpg',
+                cooking_time=10,
+                text='Описание',
+                author=cls.user,
+            )
+            recipe.tags.add(tag)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient, quantity=1
+            )
+            recipe.is_favorited.add(cls.user)
+            recipe.is_in_shopping_cart.add(cls.user)
+
+    def assert_uses_indexes(self, queryset, ordered_walk=False):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            self.skipTest(f'Нет разбора плана для {connection.vendor}')
+        plan = queryset.explain()
+        self.assertEqual(pattern.findall(plan), [], plan)
+        walk_pattern = INDEX_WALK_PATTERNS.get(connection.vendor)
+        if walk_pattern is not None and not ordered_walk:
+            self.assertEqual(walk_pattern.findall(plan), [], plan)
+
+    def test_default_ordering(self):
+        self.assert_uses_indexes(Recipe.objects.all()[:6], ordered_walk=True)
+
+    def test_feed(self):
+        self.assert_uses_indexes(
+            Recipe.objects.order_by('-created_at', '-id')[:6],
+            ordered_walk=True,
+        )
+
+    def test_author_filter(self):
+        self.assert_uses_indexes(
+            Recipe.objects.filter(author=self.user)[:6]
+        )
+
+    def test_tags_filter(self):
+        self.assert_uses_indexes(
+            Recipe.objects.filter(tags__slug__in=['tag']).distinct()[:6]
+        )
+
+    def test_favorites_filter(self):
+        self.assert_uses_indexes(
+            Recipe.objects.filter(is_favorited=self.user)[:6]
+        )
+
+    def test_shopping_cart_filter(self):
+        self.assert_uses_indexes(
+            Recipe.objects.filter(is_in_shopping_cart=self.user)[:6]
+        )
+
+    def test_shopping_list(self):
+        self.assert_uses_indexes(get_shopping_list(self.user))
+
+    def test_subscriptions(self):
+        self.assert_uses_indexes(
+            User.objects.filter(subscribers=self.user)
+        )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeWriteQueryCountTest(APITestCase):
+    # Создание и изменение рецепта выполняются за число запросов,
+    # не зависящее от количества ингредиентов
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {i}', color='#000000', slug=f'tag-{i}'
+            ) for i in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            ) for i in range(12)
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+
+    def payload(self, ingredients, amount=1):
+        return {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': make_image(),
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient in ingredients
+            ],
+        }
+
+    def create(self, ingredients):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                RECIPES_URL, self.payload(ingredients), format='json'
+            )
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id'], context
+
+    def update(self, recipe_id, data):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                f'{RECIPES_URL}{recipe_id}/', data, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        return context
+
+    def test_create(self):
+        _, small = self.create(self.ingredients[:2])
+        with self.assertNumQueries(len(small)):
+            self.create(self.ingredients[:10])
+
+    def test_update(self):
+        counts = []
+        for size in (2, 10):
+            recipe_id, _ = self.create(self.ingredients[:size])
+            data = self.payload(self.ingredients[1:size + 1])
+            data['ingredients'][0]['amount'] = 5
+            del data['image']
+            counts.append(len(self.update(recipe_id, data)))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_update_keeps_unchanged_rows(self):
+        recipe_id, _ = self.create(self.ingredients[:10])
+        rows = dict(
+            RecipeIngredient.objects.filter(
+                recipe_id=recipe_id
+            ).values_list('ingredient_id', 'id')
+        )
+        data = self.payload(self.ingredients[:10])
+        del data['image']
+        context = self.update(recipe_id, data)
+        self.assertFalse([
+            query for query in context.captured_queries
+            if query['sql'].startswith('INSERT')
+        ])
+        self.assertEqual(
+            dict(
+                RecipeIngredient.objects.filter(
+                    recipe_id=recipe_id
+                ).values_list('ingredient_id', 'id')
+            ),
+            rows,
+        )
+
+
+class RelationCounterTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт',
+            image='recipes/images/recipe.jpg',
+            cooking_time=10,
+            text='Описание',
+            author=cls.author,
+        )
+
+    def test_remove_missing_relation(self):
+        self.recipe.is_favorited.add(self.author)
+        self.recipe.is_favorited.remove(self.author, self.reader)
+        self.reader.favorited_recipes.remove(self.recipe)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+        self.recipe.is_favorited.add(self.author)
+        self.reader.favorited_recipes.remove(self.recipe)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_remove_missing_subscription(self):
+        self.author.subscribers.add(self.reader)
+        self.reader.subscriptions.remove(self.author)
+        self.reader.subscriptions.remove(self.author)
+        self.author.subscribers.add(self.reader)
+        self.author.subscribers.remove(self.author)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 1)
+
+
+class RecipeRankingTest(APITestCase):
+    # Тренд определяется свежестью добавлений, а не возрастом рецепта
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        cls.readers = [
+            User.objects.create_user(
+                username=f'reader{i}',
+                email=f'reader{i}@example.com',
+                password='pass',
+            ) for i in range(3)
+        ]
+
+    def create_recipe(self, age):
+        recipe = Recipe.objects.create(
+            name='Рецепт',
+            image='recipes/images/recipe.jpg',
+            cooking_time=10,
+            text='Описание',
+            author=self.author,
+        )
+        Recipe.objects.filter(pk=recipe.pk).update(
+            created_at=timezone.now() - age
+        )
+        return recipe
+
+    def age_activity(self, recipe, age):
+        RecipeActivity.objects.filter(recipe=recipe).update(
+            created_at=timezone.now() - age
+        )
+
+    def test_old_recipe_with_recent_activity_trends(self):
+        old = self.create_recipe(timedelta(days=365))
+        new = self.create_recipe(timedelta(hours=1))
+        new.is_favorited.add(*self.readers)
+        self.age_activity(new, timedelta(hours=48))
+        self.client.force_authenticate(self.readers[0])
+        response = self.client.post(f'{RECIPES_URL}{old.id}/favorite/')
+        self.assertEqual(response.status_code, 201)
+
+        call_command('refresh_rankings', stdout=StringIO())
+        response = self.client.get(f'{RECIPES_URL}?ordering=trending')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results'][:2]],
+            [old.id, new.id],
+        )
+        rankings = RecipeRanking.objects.in_bulk()
+        self.assertGreater(
+            rankings[new.id].popularity, rankings[old.id].popularity
+        )
+
+    def test_activity_outside_window(self):
+        recipe = self.create_recipe(timedelta(hours=1))
+        recipe.is_in_shopping_cart.add(self.readers[0])
+        self.age_activity(recipe, timedelta(hours=100))
+        call_command(
+            'refresh_rankings', window_hours=72, stdout=StringIO()
+        )
+        self.assertEqual(RecipeRanking.objects.get(recipe=recipe).trending, 0)
+        self.assertFalse(RecipeActivity.objects.exists())
+
+
+class RecipeMatchIndexTest(APITestCase):
+
+    def test_big_recipe_ids(self):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        ingredient = Ingredient.objects.create(
+            name='Ингредиент', measurement_unit='г'
+        )
+        recipe = Recipe.objects.create(
+            id=2 ** 32 + 1,
+            name='Рецепт',
+            image='recipes/images/recipe.jpg',
+            cooking_time=10,
+            text='Описание',
+            author=author,
+        )
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=ingredient, quantity=1
+        )
+        index = RecipeMatchIndex()
+        expected = [(1.0, 1, recipe.id)]
+        self.assertEqual(index.match([ingredient.id], 10), expected)
+        index.update()
+        self.assertEqual(index.match([ingredient.id], 10), expected)
+
+
+class RecipeBatchTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass'
+        )
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт',
+            image='recipes/images/recipe.jpg',
+            cooking_time=10,
+            text='Описание',
+            author=cls.user,
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_statuses(self):
+        response = self.client.post(
+            f'{RECIPES_URL}favorite/',
+            {'ids': [self.recipe.id, self.recipe.id + 1]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['added', 'not_found'],
+        )
+
+    def test_id_out_of_range(self):
+        response = self.client.post(
+            f'{RECIPES_URL}shopping_cart/', {'ids': [2 ** 63]}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipeCursorTest(RecipeListTestCase):
+
+    def test_cursor_feed(self):
+        self.create_recipes(3)
+        response = self.client.get(f'{RECIPES_URL}?cursor=&limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_cursor_rejects_other_orderings(self):
+        self.create_recipes(1)
+        for query in ('search=Рецепт', 'ordering=popular'):
+            response = self.client.get(f'{RECIPES_URL}?cursor=&{query}')
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn('cursor', response.data)
@@ -0,0 +1,111 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import logging
+import os
+
+from PIL import Image, ImageOps, features
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.utils import timezone
+
+from recipes.models import Recipe
+
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'recipes/images/variants/'
+VARIANT_FORMAT, VARIANT_EXTENSION = (
+    ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+)
+
+executor = ThreadPoolExecutor(
+    max_workers=max(settings.IMAGE_WORKERS, 1),
+    thread_name_prefix='image-variants',
+)
+
+
+def touch(storage, name):
+    # Имена файлов — хэши содержимого, и существующий файл переиспользуется.
+    # Он мог давно остаться без ссылок: свежее время изменения защищает его
+    # от gc_media, пока ссылающийся рецепт не сохранён
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        return storage.exists(name)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def save_once(storage, name, content):
+    saved = storage.save(name, content)
+    if saved != name and storage.exists(name):
+        # Тот же файл одновременно сохранил параллельный запрос,
+        # а хранилище выбрало для копии другое имя
+        storage.delete(saved)
+        return name
+    return saved
+
+
+def variant_name(source, variant):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return f'{VARIANTS_DIR}{stem}_{variant}.{VARIANT_EXTENSION}'
+
+
+def render_variant(image, size):
+    variant = image.copy()
+    variant.thumbnail(size, Image.LANCZOS)
+    if variant.mode not in ('RGB', 'RGBA') or VARIANT_FORMAT == 'JPEG':
+        variant = variant.convert('RGB')
+    buffer = BytesIO()
+    variant.save(
+        buffer, VARIANT_FORMAT, quality=settings.IMAGE_VARIANT_QUALITY
+    )
+    return ContentFile(buffer.getvalue())
+
+
+def build_variants(recipe_id, source, force=False):
+    # Имена оригиналов — хэши содержимого, поэтому готовые копии
+    # того же файла от других рецептов переиспользуются
+    variants = {'source': source}
+    missing = {}
+    for variant, size in settings.IMAGE_VARIANTS.items():
+        name = variant_name(source, variant)
+        if force and default_storage.exists(name):
+            default_storage.delete(name)
+        if touch(default_storage, name):
+            variants[variant] = name
+        else:
+            missing[variant] = (name, size)
+    if missing:
+        with default_storage.open(source) as file:
+            image = ImageOps.exif_transpose(Image.open(file))
+            for variant, (name, size) in missing.items():
+                variants[variant] = save_once(
+                    default_storage, name, render_variant(image, size)
+                )
+    # Если картинку успели заменить, варианты от старой не записываются.
+    # updated_at сдвигается, чтобы сменился ETag рецепта
+    Recipe.objects.filter(pk=recipe_id, image=source).update(
+        image_variants=variants, updated_at=timezone.now()
+    )
+    return variants
+
+
+def run_build(recipe_id, source):
+    try:
+        build_variants(recipe_id, source)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', source)
+    finally:
+        connections.close_all()
+
+
+def schedule_variants(recipe_id, source):
+    # При IMAGE_WORKERS = 0 варианты строит команда build_image_variants
+    if settings.IMAGE_WORKERS > 0:
+        executor.submit(run_build, recipe_id, source)
@@ -1,6 +1,17 @@
+from functools import lru_cache
+import logging
+
+from django.conf import settings
+from django.db.models import Sum
 from fpdf import FPDF
 
+from recipes.models import RecipeIngredient
+
 
+logger = logging.getLogger(__name__)
+
+FONT_NAME = 'FreeSans'
+FONT_PATH = str(settings.BASE_DIR / 'static' / 'freesans.ttf')
 FONT_SIZE = 12
 WIDTH = 0
 HEIGHT = 10
@@ -12,25 +23,76 @@ ALIGN_BODY = 'L'  # выравнивание по левому краю
 
 HEIGHT_EMPTY_STRING_FOR_TITLE = 10
 
+# Символы, которые всегда встраиваются в подмножество шрифта: так у всех
+# документов совпадает набор глифов и кэш ширин переиспользуется
+FONT_SUBSET = (
+    tuple(range(32, 127)) + tuple(range(0x400, 0x460)) + (0x2014,)
+)
+FONT_WIDTHS_CACHE_SIZE = 32
+
+font_widths_cache = {}
+
+
+@lru_cache(maxsize=None)
+def get_font():
+    template = FPDF()
+    template.add_font(FONT_NAME, '', FONT_PATH, uni=True)
+    # static/freesans.pkl хранит относительный ttffile, а FPDF берёт путь
+    # из него, а не из FONT_PATH: без замены PDF зависит от рабочего каталога
+    for font in template.fonts.values():
+        font['ttffile'] = FONT_PATH
+    return template.fonts, template.font_files
+
 
 class PDF(FPDF):
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fonts, font_files = get_font()
+        self.fonts = {
+            key: dict(
+                font,
+                subset=font['subset'] + [
+                    char for char in FONT_SUBSET if char not in font['subset']
+                ]
+            ) for key, font in fonts.items()
+        }
+        self.font_files = {
+            key: dict(info) for key, info in font_files.items()
+        }
+
+    def _putTTfontwidths(self, font, maxUni):
+        key = (font['fontkey'], maxUni, frozenset(font['subset']))
+        lines = font_widths_cache.get(key)
+        if lines is None:
+            lines = []
+            self._out = lines.append
+            try:
+                super()._putTTfontwidths(font, maxUni)
+            finally:
+                del self._out
+            if len(font_widths_cache) >= FONT_WIDTHS_CACHE_SIZE:
+                font_widths_cache.pop(next(iter(font_widths_cache)))
+            font_widths_cache[key] = lines
+        for line in lines:
+            self._out(line)
+
     def header(self):
-        self.set_font('FreeSans', '', FONT_SIZE)
+        self.set_font(FONT_NAME, '', FONT_SIZE)
         self.cell(
             WIDTH, HEIGHT, 'Список покупок', IS_BORDER, MOVE_TO_NEXT_LINE,
             ALIGN_HEADER
         )
 
     def chapter_title(self, title):
-        self.set_font('FreeSans', '', FONT_SIZE)
+        self.set_font(FONT_NAME, '', FONT_SIZE)
         self.cell(
             WIDTH, HEIGHT, title, IS_BORDER, MOVE_TO_NEXT_LINE, ALIGN_BODY
         )
         self.ln(HEIGHT_EMPTY_STRING_FOR_TITLE)
 
     def chapter_body(self, body):
-        self.set_font('FreeSans', '', FONT_SIZE)
+        self.set_font(FONT_NAME, '', FONT_SIZE)
         self.multi_cell(WIDTH, HEIGHT, body)
         self.ln()
 
@@ -38,3 +100,24 @@ class PDF(FPDF):
         self.add_page()
         self.chapter_title(title)
         self.chapter_body(body)
+
+
+def get_shopping_list(user):
+    return RecipeIngredient.objects.filter(
+        recipe__is_in_shopping_cart=user
+    ).values(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(
+        total_quantity=Sum('quantity')
+    ).order_by('ingredient__name', 'ingredient__measurement_unit')
+
+
+def warm_pdf_cache():
+    # Прогрев лишь экономит время первого запроса: ошибка здесь не должна
+    # мешать запуску Django, шрифт тогда загрузится при первом PDF
+    try:
+        pdf = PDF()
+        pdf.print_chapter('', '')
+        pdf.output(dest='S')
+    except Exception:
+        logger.exception('Не удалось прогреть кэш шрифта для PDF')
@@ -1,36 +1,92 @@
-import os
-import tempfile
-
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import serializers, status
 from rest_framework.decorators import action, permission_classes
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
+from recipes.activity import record_activity
+from recipes.cache import (
+    INGREDIENTS_CACHE,
+    TAGS_CACHE,
+    CachedListMixin,
+    ConditionalRecipeMixin,
+)
+from recipes.counters import (
+    add_relation,
+    add_relations,
+    remove_relation,
+    remove_relations,
+)
 from recipes.filters import IngredientFilter
-from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
-from recipes.paginators import StandardResultsSetPagination
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.paginators import (
+    RecipeCursorPagination,
+    StandardResultsSetPagination,
+)
 from recipes.permissions import IsOwnerOrReadOnly
+from recipes.renderers import (
+    CSVShoppingListRenderer,
+    PDFShoppingListRenderer,
+    ShoppingListNegotiation,
+    TextShoppingListRenderer,
+)
+from recipes.search import recipe_match_index, search_recipes
 from recipes.serializers import (
     IngredientReadSerializer,
+    RecipeIdsSerializer,
+    RecipeMatchSerializer,
     RecipeReadSerializer,
     RecipeWriteSerializer,
     SimpleRecipeSerializer,
     TagReadSerializer,
 )
-from recipes.utils import PDF
+from recipes.utils import get_shopping_list
+
 
+RECIPE_ORDERINGS = {
+    'new': ('-created_at', '-id'),
+    'popular': (
+        F('ranking__popularity').desc(nulls_last=True), '-created_at', '-id'
+    ),
+    'trending': (
+        F('ranking__trending').desc(nulls_last=True), '-created_at', '-id'
+    ),
+}
 
-class RecipeViewSet(ModelViewSet):
+
+class RecipeViewSet(ConditionalRecipeMixin, ModelViewSet):
     pagination_class = StandardResultsSetPagination
 
+    @property
+    def paginator(self):
+        # ?cursor= включает курсорную пагинацию вместо page/limit;
+        # несовместимые с ней параметры отклоняет get_queryset
+        if (
+            not hasattr(self, '_paginator')
+            and self.action == 'list'
+            and self.uses_cursor()
+        ):
+            self._paginator = RecipeCursorPagination()
+        return super().paginator
+
+    def uses_cursor(self):
+        return (
+            RecipeCursorPagination.cursor_query_param
+            in self.request.query_params
+        )
+
     def get_serializer_class(self):
         if self.action in ['list', 'retrieve']:
             return RecipeReadSerializer
+        if self.action == 'match':
+            return RecipeMatchSerializer
         return RecipeWriteSerializer
 
     def perform_create(self, serializer):
@@ -38,12 +94,38 @@ class RecipeViewSet(ModelViewSet):
 
     def get_queryset(self):
         queryset = Recipe.objects.all()
+        if self.action in ['list', 'retrieve']:
+            queryset = queryset.for_reading()
         author_id = self.request.query_params.get('author', None)
         tags = self.request.query_params.getlist('tags', None)
         is_favorited = self.request.query_params.get('is_favorited', None)
         is_in_shopping_cart = self.request.query_params.get(
             'is_in_shopping_cart', None
         )
+        ordering = self.request.query_params.get('ordering', None)
+        search = self.request.query_params.get('search', '').strip()
+
+        if ordering is not None and ordering not in RECIPE_ORDERINGS:
+            raise serializers.ValidationError(
+                {
+                    'ordering':
+                        'Это поле может принять только '
+                        + ', '.join(RECIPE_ORDERINGS) + '.'
+                }
+            )
+
+        if self.action == 'list' and self.uses_cursor() and (
+            search or ordering not in (None, 'new')
+        ):
+            # Курсор упорядочен по дате создания и молча заменил бы
+            # сортировку по релевантности или рейтингу
+            raise serializers.ValidationError(
+                {
+                    'cursor':
+                        'Курсорная пагинация работает только с сортировкой '
+                        'new и без search.'
+                }
+            )
 
         if is_favorited is not None and is_favorited not in ['0', '1']:
             raise serializers.ValidationError(
@@ -77,8 +159,24 @@ class RecipeViewSet(ModelViewSet):
                     is_in_shopping_cart=self.request.user
                 )
 
+        if search:
+            queryset = search_recipes(queryset, search)
+
+        if ordering is not None:
+            queryset = queryset.order_by(*RECIPE_ORDERINGS[ordering])
+
         return queryset
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Ошибки выгрузки списка покупок отдаются JSON, а не в формате файла
+        if (
+            self.action == 'download_shopping_cart'
+            and isinstance(response, Response)
+        ):
+            request.accepted_renderer = JSONRenderer()
+            request.accepted_media_type = JSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
+
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
@@ -90,7 +188,13 @@ class RecipeViewSet(ModelViewSet):
         detail=False,
         methods=['get'],
         url_path='download_shopping_cart',
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        renderer_classes=[
+            PDFShoppingListRenderer,
+            TextShoppingListRenderer,
+            CSVShoppingListRenderer,
+        ],
+        content_negotiation_class=ShoppingListNegotiation,
     )
     def download_shopping_cart(self, request):
         if not request.user.is_authenticated:
@@ -99,79 +203,75 @@ class RecipeViewSet(ModelViewSet):
                 status=status.HTTP_401_UNAUTHORIZED
             )
 
-        response = HttpResponse(content_type='application/pdf')
+        renderer = request.accepted_renderer
+        ingredients = get_shopping_list(request.user)
+        if renderer.streaming:
+            response = StreamingHttpResponse(
+                renderer.stream(ingredients.iterator()),
+                content_type=renderer.content_type
+            )
+        else:
+            response = HttpResponse(
+                renderer.render(ingredients),
+                content_type=renderer.content_type
+            )
         response['Content-Disposition'] = (
             'attachment; '
-            'filename="shopping_cart.pdf"'
+            f'filename="{renderer.filename}"'
         )
+        return response
 
-        pdf = PDF()
-        pdf.add_font('FreeSans', '', 'static/freesans.ttf', uni=True)
-
-        recipes_in_cart = Recipe.objects.filter(is_in_shopping_cart=True)
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__in=recipes_in_cart
-        )
-        ingredients = ingredients.values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(total_quantity=Sum('quantity'))
-        text = ''
-        for ingredient in ingredients:
-            text += '\n' + (
-                f'{ingredient["ingredient__name"]} '
-                f'({ingredient["ingredient__measurement_unit"]}) — '
-                f'{ingredient["total_quantity"]}'
+    @action(detail=False, methods=['get'])
+    def match(self, request):
+        ingredient_ids = request.query_params.getlist('ingredients')
+        if not ingredient_ids or not all(
+            ingredient_id.isdigit() for ingredient_id in ingredient_ids
+        ):
+            raise serializers.ValidationError(
+                {'ingredients': 'Укажите id имеющихся ингредиентов.'}
             )
-        pdf.print_chapter('Список покупок:', text)
 
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp:
-            pdf.output(temp.name, 'F')
-            temp.seek(0)
-            response.write(temp.read())
-            temp.close()
-
-        os.unlink(temp.name)
-        return response
-
-    @action(detail=True, methods=['post', 'delete'])
-    @permission_classes([IsAuthenticated])
-    def shopping_cart(self, request, *args, **kwargs):
+        matches = self.paginate_queryset(
+            recipe_match_index.match(
+                map(int, ingredient_ids), settings.RECIPE_MATCH_LIMIT
+            )
+        )
+        recipes = Recipe.objects.for_reading().in_bulk(
+            [recipe_id for _, _, recipe_id in matches]
+        )
+        found = []
+        for coverage, _, recipe_id in matches:
+            if recipe_id in recipes:
+                recipe = recipes[recipe_id]
+                recipe.coverage = coverage
+                found.append(recipe)
+        serializer = self.get_serializer(found, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def toggle_relation(self, request, field_name, counter_field, kind,
+                        messages):
         if not request.user.is_authenticated:
             return Response(
                 {'detail': 'Пользователь не аутентифицирован'},
                 status=status.HTTP_401_UNAUTHORIZED
             )
 
-        try:
-            recipe = Recipe.objects.get(pk=self.kwargs['pk'])
-        except ObjectDoesNotExist:
-            return Response(
-                {'detail': 'Рецепт не найден'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        if request.method == 'POST':
-            if request.user in recipe.is_in_shopping_cart.all():
-                return Response(
-                    {'detail': 'Рецепт уже в корзине покупок'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            recipe.is_in_shopping_cart.add(request.user)
-            serializer = SimpleRecipeSerializer(recipe)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-        elif request.method == 'DELETE':
-            if request.user not in recipe.is_in_shopping_cart.all():
+        if request.method == 'DELETE':
+            if remove_relation(
+                Recipe, self.kwargs['pk'], field_name, counter_field,
+                request.user, kind
+            ):
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            if not Recipe.objects.filter(pk=self.kwargs['pk']).exists():
                 return Response(
-                    {'detail': 'Рецепт отсутствует в корзине покупок'},
+                    {'detail': 'Рецепт не найден'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            recipe.is_in_shopping_cart.remove(request.user)
-            return Response(status=status.HTTP_204_NO_CONTENT)
+            return Response(
+                {'detail': messages['missing']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-    @action(detail=True, methods=['post', 'delete'])
-    @permission_classes([IsAuthenticated])
-    def favorite(self, request, *args, **kwargs):
         try:
             recipe = Recipe.objects.get(pk=self.kwargs['pk'])
         except ObjectDoesNotExist:
@@ -179,36 +279,125 @@ class RecipeViewSet(ModelViewSet):
                 {'detail': 'Рецепт не найден'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if not add_relation(
+            Recipe, recipe.pk, field_name, counter_field, request.user, kind
+        ):
+            return Response(
+                {'detail': messages['exists']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        record_activity([recipe.pk], kind)
+        serializer = SimpleRecipeSerializer(recipe)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def toggle_relations(self, request, field_name, counter_field, kind):
+        # Пакетная версия toggle_relation: результат по каждому id
+        if not request.user.is_authenticated:
+            return Response(
+                {'detail': 'Пользователь не аутентифицирован'},
+                status=status.HTTP_401_UNAUTHORIZED
+            )
 
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
         if request.method == 'POST':
-            if request.user in recipe.is_favorited.all():
-                return Response(
-                    {'detail': 'Рецепт уже в избранном'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            recipe.is_favorited.add(request.user)
+            change, statuses = add_relations, ('added', 'exists')
+        else:
+            change, statuses = remove_relations, ('removed', 'missing')
+        with transaction.atomic():
+            # Найденные рецепты блокируются от удаления до конца транзакции,
+            # иначе вставка связи с удалённым рецептом нарушила бы внешний
+            # ключ. Счётчики этих строк всё равно обновляются ниже, и
+            # блокировка FOR NO KEY UPDATE берётся в порядке id
+            found = set(
+                Recipe.objects.filter(id__in=ids).order_by(
+                    'id'
+                ).select_for_update(no_key=True).values_list('id', flat=True)
+            )
+            changed = set(change(
+                Recipe, [pk for pk in ids if pk in found], field_name,
+                counter_field, request.user, kind
+            ))
+            if request.method == 'POST':
+                record_activity(changed, kind)
+        results = []
+        for pk in ids:
+            if pk not in found:
+                result = 'not_found'
+            elif pk in changed:
+                result = statuses[0]
+            else:
+                result = statuses[1]
+            results.append({'id': pk, 'status': result})
+        return Response({'results': results})
 
-            serializer = SimpleRecipeSerializer(recipe)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='shopping_cart',
+        url_name='shopping-cart-batch',
+    )
+    def shopping_cart_batch(self, request):
+        return self.toggle_relations(
+            request,
+            'is_in_shopping_cart',
+            'shopping_cart_count',
+            'in_shopping_cart',
+        )
 
-        if request.method == 'DELETE':
-            if request.user not in recipe.is_favorited.all():
-                return Response(
-                    {'detail': 'Рецепт отсутствует в избранном'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            recipe.is_favorited.remove(request.user)
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='favorite',
+        url_name='favorite-batch',
+    )
+    def favorite_batch(self, request):
+        return self.toggle_relations(
+            request,
+            'is_favorited',
+            'favorites_count',
+            'favorited',
+        )
 
-            return Response(status=status.HTTP_204_NO_CONTENT)
+    @action(detail=True, methods=['post', 'delete'])
+    @permission_classes([IsAuthenticated])
+    def shopping_cart(self, request, *args, **kwargs):
+        return self.toggle_relation(
+            request,
+            'is_in_shopping_cart',
+            'shopping_cart_count',
+            'in_shopping_cart',
+            {
+                'exists': 'Рецепт уже в корзине покупок',
+                'missing': 'Рецепт отсутствует в корзине покупок',
+            },
+        )
+
+    @action(detail=True, methods=['post', 'delete'])
+    @permission_classes([IsAuthenticated])
+    def favorite(self, request, *args, **kwargs):
+        return self.toggle_relation(
+            request,
+            'is_favorited',
+            'favorites_count',
+            'favorited',
+            {
+                'exists': 'Рецепт уже в избранном',
+                'missing': 'Рецепт отсутствует в избранном',
+            },
+        )
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(CachedListMixin, ReadOnlyModelViewSet):
+    cache_namespace = TAGS_CACHE
     queryset = Tag.objects.all()
     serializer_class = TagReadSerializer
     pagination_class = None
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(CachedListMixin, ReadOnlyModelViewSet):
+    cache_namespace = INGREDIENTS_CACHE
     queryset = Ingredient.objects.all()
     serializer_class = IngredientReadSerializer
     pagination_class = None
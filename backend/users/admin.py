@@ -12,12 +12,7 @@ class CustomUserAdmin(admin.ModelAdmin):
         'first_name',
         'last_name',
         'email',
-        'display_subscribers',
+        'subscribers_count',
     )
     search_fields = ('username',)
     list_filter = ('username', 'email')
-
-    def display_subscribers(self, obj):
-        return obj.subscribers.count()
-
-    display_subscribers.short_description = 'Подписчики'
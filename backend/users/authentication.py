@@ -0,0 +1,127 @@
+from collections import OrderedDict
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+def token_key(key):
+    return f'auth:token:{key}'
+
+
+def generation_key(key):
+    return f'auth:token:generation:{key}'
+
+
+def detach(instance):
+    # Новый экземпляр из значений полей: у копии свои кэши связей
+    # и prefetch, общие с кэшем объекты в запрос не попадают
+    fields = instance._meta.concrete_fields
+    return type(instance).from_db(
+        instance._state.db,
+        [field.attname for field in fields],
+        [getattr(instance, field.attname) for field in fields],
+    )
+
+
+class TokenCache:
+    # LRU с TTL в памяти процесса: ключ токена -> (пользователь, токен).
+    # Запись хранит поколение токена из общего кэша и при каждом чтении
+    # сверяется с ним: delete() в любом воркере меняет поколение,
+    # и записи остальных воркеров перестают действовать.
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def generation(self, key):
+        return cache.get(generation_key(key))
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires, generation = entry
+        if (
+            expires < time.monotonic()
+            or self.generation(key) != generation
+        ):
+            with self.lock:
+                if self.entries.get(key) is entry:
+                    del self.entries[key]
+            return None
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, generation):
+        # generation читается до загрузки из базы: отзыв токена во время
+        # загрузки сменит поколение, и запись не будет принята
+        with self.lock:
+            self.entries[key] = (
+                value, time.monotonic() + self.timeout, generation
+            )
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+        # Записи старше timeout истекают сами, дольше хранить поколение
+        # не нужно
+        cache.set(generation_key(key), uuid.uuid4().hex, self.timeout)
+
+
+token_cache = TokenCache(
+    settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TIMEOUT
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    # Пользователь по токену берётся из кэша процесса, затем из общего
+    # кэша (если TOKEN_CACHE_SHARED_TIMEOUT > 0) и только потом из базы.
+    # Отзыв токена виден другим воркерам через поколение в CACHE_BACKEND,
+    # поэтому кэш процесса по умолчанию включён только с общим бэкендом.
+
+    def authenticate_credentials(self, key):
+        if not settings.TOKEN_CACHE_TIMEOUT:
+            return super().authenticate_credentials(key)
+
+        credentials = token_cache.get(key)
+        if credentials is None:
+            generation = token_cache.generation(key)
+            if settings.TOKEN_CACHE_SHARED_TIMEOUT:
+                credentials = cache.get(token_key(key))
+            if credentials is None:
+                credentials = super().authenticate_credentials(key)
+                if settings.TOKEN_CACHE_SHARED_TIMEOUT:
+                    cache.set(
+                        token_key(key),
+                        credentials,
+                        settings.TOKEN_CACHE_SHARED_TIMEOUT,
+                    )
+            token_cache.set(key, credentials, generation)
+        user, token = credentials
+        user, token = detach(user), detach(token)
+        token.user = user
+        return user, token
+
+
+def invalidate_token(key):
+    token_cache.delete(key)
+    if settings.TOKEN_CACHE_SHARED_TIMEOUT:
+        cache.delete(token_key(key))
+
+
+def invalidate_user_tokens(user):
+    for key in Token.objects.filter(user=user).values_list('key', flat=True):
+        invalidate_token(key)
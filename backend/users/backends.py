@@ -3,20 +3,26 @@ from django.contrib.auth.backends import ModelBackend
 
 
 class EmailBackend(ModelBackend):
+    # Вход по email без учёта регистра (уникальный индекс по UPPER(email)).
+    # Вход по логину (админка) сразу передаётся ModelBackend, чтобы пароль
+    # не хэшировался дважды. check_password сам перехэширует пароль при
+    # смене алгоритма, а get_user наследуется от ModelBackend и вызывается
+    # AuthenticationMiddleware один раз за запрос.
 
-    def authenticate(self, request, username=None, password=None, **kwargs):
+    def authenticate(self, request, username=None, password=None,
+                     email=None, **kwargs):
         UserModel = get_user_model()
+        if email is None or password is None:
+            return None
         try:
-            user = UserModel.objects.get(email=username)
+            user = UserModel._default_manager.get(email__iexact=email)
         except UserModel.DoesNotExist:
+            # Хэширование и для несуществующего пользователя, чтобы время
+            # ответа не выдавало, зарегистрирован ли email
+            UserModel().set_password(password)
             return None
 
-        if user.check_password(password):
+        if user.check_password(password) and self.user_can_authenticate(
+            user
+        ):
             return user
-
-    def get_user(self, user_id):
-        UserModel = get_user_model()
-        try:
-            return UserModel.objects.get(pk=user_id)
-        except UserModel.DoesNotExist:
-            return None
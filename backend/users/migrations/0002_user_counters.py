@@ -0,0 +1,51 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(queryset, field_name):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field_name: OuterRef('pk')}).order_by().values(
+                field_name
+            ).annotate(total=Count('*')).values('total')
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    CustomUser = apps.get_model('users', 'CustomUser')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    CustomUser.objects.update(
+        subscribers_count=count_subquery(
+            CustomUser.subscribers.through.objects, 'from_customuser_id'
+        ),
+        recipes_count=count_subquery(Recipe.objects, 'author_id'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('recipes', '0003_auto_20240312_1108'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='subscribers_count',
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name='Подписчики'
+            ),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='recipes_count',
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name='Рецепты'
+            ),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
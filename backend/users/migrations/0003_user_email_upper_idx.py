@@ -0,0 +1,19 @@
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(
+                django.db.models.functions.text.Upper('email'),
+                name='user_email_upper_idx'
+            ),
+        ),
+    ]
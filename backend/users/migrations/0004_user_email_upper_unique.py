@@ -0,0 +1,43 @@
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import Upper
+
+
+def check_duplicates(apps, schema_editor):
+    CustomUser = apps.get_model('users', 'CustomUser')
+    users = CustomUser.objects.annotate(email_upper=Upper('email'))
+    duplicates = users.values('email_upper').annotate(
+        total=Count('id')
+    ).filter(total__gt=1).values('email_upper')
+    emails = list(
+        users.filter(email_upper__in=duplicates).order_by(
+            'email_upper', 'pk'
+        ).values_list('email', flat=True)
+    )
+    if emails:
+        raise RuntimeError(
+            'Email пользователей совпадают без учёта регистра, '
+            'объедините или переименуйте аккаунты: ' + ', '.join(emails)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_email_upper_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='customuser',
+            name='user_email_upper_idx',
+        ),
+        # Уникальный индекс по выражению Django 3.2 описать в модели
+        # не умеет, поэтому он создаётся SQL-запросом
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX user_email_upper_uniq '
+            'ON users_customuser (UPPER(email))',
+            'DROP INDEX user_email_upper_uniq',
+        ),
+    ]
@@ -26,6 +26,12 @@ class CustomUser(AbstractUser):
         related_name='subscriptions',
         verbose_name='Подписчики'
     )
+    subscribers_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Подписчики'
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Рецепты'
+    )
 
     groups = models.ManyToManyField(
         Group,
@@ -55,6 +61,8 @@ class CustomUser(AbstractUser):
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
         ordering = ('last_name', 'first_name')
+        # Email уникален без учёта регистра: индекс по UPPER(email)
+        # создаётся в миграции 0004_user_email_upper_unique
 
     def __str__(self):
         return self.username
@@ -0,0 +1,95 @@
+from django.conf import settings
+from django.core.cache import cache
+
+
+RELATIONS = {
+    'favorited': 'favorited_recipes',
+    'in_shopping_cart': 'recipes_in_cart',
+    'subscriptions': 'subscriptions',
+}
+
+
+def relation_key(user_id, kind):
+    return f'relations:{user_id}:{kind}'
+
+
+class UserRelations:
+    # Множества id рецептов в избранном и корзине и id авторов, на которых
+    # подписан пользователь. Каждое загружается одним запросом при первом
+    # обращении и переиспользуется до конца запроса.
+
+    def __init__(self, user):
+        self.user = user
+        self.loaded = {}
+
+    def get(self, kind):
+        if kind not in self.loaded:
+            self.loaded[kind] = self.load(kind)
+        return self.loaded[kind]
+
+    def load(self, kind):
+        if not self.user.is_authenticated:
+            return frozenset()
+
+        timeout = settings.USER_RELATIONS_CACHE_TIMEOUT
+        key = relation_key(self.user.pk, kind)
+        if timeout:
+            ids = cache.get(key)
+            if ids is not None:
+                return ids
+
+        ids = frozenset(
+            getattr(self.user, RELATIONS[kind]).order_by().values_list(
+                'id', flat=True
+            )
+        )
+        if timeout:
+            cache.set(key, ids, timeout)
+        return ids
+
+    @property
+    def favorited(self):
+        return self.get('favorited')
+
+    @property
+    def in_shopping_cart(self):
+        return self.get('in_shopping_cart')
+
+    @property
+    def subscriptions(self):
+        return self.get('subscriptions')
+
+
+def get_relations(request):
+    relations = getattr(request, 'user_relations', None)
+    if relations is None:
+        relations = UserRelations(request.user)
+        request.user_relations = relations
+    return relations
+
+
+def invalidate_relations(user_ids, kind):
+    if settings.USER_RELATIONS_CACHE_TIMEOUT:
+        cache.delete_many(
+            [relation_key(user_id, kind) for user_id in user_ids]
+        )
+
+
+def relations_invalidator(field_name, kind):
+    # Обработчик m2m_changed: у всех трёх связей пользователь, чьё множество
+    # меняется, находится на стороне «to» поля field_name
+
+    def receiver(sender, instance, action, reverse, pk_set, **kwargs):
+        if action not in ('post_add', 'post_remove', 'pre_clear'):
+            return
+        if reverse:
+            invalidate_relations([instance.pk], kind)
+        elif action == 'pre_clear':
+            invalidate_relations(
+                getattr(instance, field_name).values_list('pk', flat=True),
+                kind,
+            )
+        elif pk_set:
+            invalidate_relations(pk_set, kind)
+
+    return receiver
@@ -1,7 +1,12 @@
+from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
+from djoser.serializers import (
+    TokenCreateSerializer as BaseTokenCreateSerializer,
+)
 from rest_framework import serializers
 
 from users.models import CustomUser
+from users.relations import get_relations
 
 
 class UserListSerializer(serializers.ModelSerializer):
@@ -15,8 +20,7 @@ class UserListSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        return obj.subscribers.filter(id=user.id).exists()
+        return obj.id in get_relations(self.context['request']).subscriptions
 
 
 class ReadUserSerializer(serializers.ModelSerializer):
@@ -32,6 +36,14 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         fields = ('email', 'username', 'first_name', 'last_name', 'password')
         extra_kwargs = {'password': {'write_only': True}}
 
+    def validate_email(self, value):
+        # Вход по email не учитывает регистр, поэтому и регистрация
+        if CustomUser.objects.filter(email__iexact=value).exists():
+            raise serializers.ValidationError(
+                'Пользователь с таким email уже существует.'
+            )
+        return value
+
     def create(self, validated_data):
         user = CustomUser.objects.create_user(**validated_data)
         return user
@@ -40,7 +52,22 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return ReadUserSerializer(instance).data
 
 
-class PasswordChangeSerializer(serializers.ModelSerializer):
+class TokenCreateSerializer(BaseTokenCreateSerializer):
+    # Без повторного поиска пользователя и второй проверки пароля,
+    # которые делает djoser, если authenticate() вернул None
+
+    def validate(self, attrs):
+        self.user = authenticate(
+            request=self.context.get('request'),
+            email=attrs.get('email'),
+            password=attrs.get('password'),
+        )
+        if self.user is None:
+            self.fail('invalid_credentials')
+        return attrs
+
+
+class PasswordChangeSerializer(serializers.Serializer):
     new_password = serializers.CharField(write_only=True)
     current_password = serializers.CharField(write_only=True)
 
@@ -54,17 +81,18 @@ class PasswordChangeSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 {'current_password': 'Неверный пароль'}
             )
+        return data
 
     def save(self, **kwargs):
         user = self.context['request'].user
         user.set_password(self.validated_data.get('new_password'))
+        # Кэш токенов сбрасывается обработчиком post_save пользователя
         user.save()
         return user
 
 
 class SubscriberSerializer(serializers.ModelSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -77,17 +105,16 @@ class SubscriberSerializer(serializers.ModelSerializer):
     def get_recipes(self, obj):
         from recipes.serializers import SimpleRecipeSerializer
 
-        request = self.context.get('request')
-        recipes_limit = request.query_params.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if recipes_limit is not None:
-            recipes = recipes[:int(recipes_limit)]
+        if hasattr(obj, 'recipe_previews'):
+            recipes = obj.recipe_previews
+        else:
+            request = self.context.get('request')
+            recipes_limit = request.query_params.get('recipes_limit')
+            recipes = obj.recipes.all()
+            if recipes_limit is not None:
+                recipes = recipes[:int(recipes_limit)]
 
         return SimpleRecipeSerializer(recipes, many=True).data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        return obj.subscribers.filter(id=request.user.id).exists()
+        return obj.id in get_relations(self.context['request']).subscriptions
@@ -0,0 +1,24 @@
+from django.contrib.auth import get_user_model, user_logged_out
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from users.authentication import invalidate_token, invalidate_user_tokens
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(user_logged_out)
+def invalidate_logged_out_token(sender, request, user, **kwargs):
+    token = getattr(request, 'auth', None)
+    if isinstance(token, Token):
+        invalidate_token(token.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_saved_user_tokens(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_user_tokens(instance)
@@ -0,0 +1,101 @@
+from unittest import mock
+
+from django.contrib.auth import authenticate, get_user_model
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from users.authentication import CachedTokenAuthentication, TokenCache
+
+
+User = get_user_model()
+
+USERS_URL = '/api/users/'
+LOGIN_URL = '/api/auth/token/login/'
+LOGOUT_URL = '/api/auth/token/logout/'
+ME_URL = '/api/users/me/'
+
+
+class EmailAuthenticationTest(APITestCase):
+    # Email уникален и проверяется при входе без учёта регистра
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='User@example.com', password='pass'
+        )
+
+    def test_register_case_variant_email(self):
+        response = self.client.post(USERS_URL, {
+            'email': 'user@EXAMPLE.com',
+            'username': 'other',
+            'first_name': 'Имя',
+            'last_name': 'Фамилия',
+            'password': 'Strong-pass-123',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.data)
+
+    def test_login_ignores_email_case(self):
+        response = self.client.post(
+            LOGIN_URL, {'email': 'USER@example.com', 'password': 'pass'}
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_login_by_username(self):
+        self.assertEqual(
+            authenticate(username='user', password='pass'), self.user
+        )
+        self.assertIsNone(
+            authenticate(username='User@example.com', password='pass')
+        )
+
+
+@override_settings(TOKEN_CACHE_TIMEOUT=60)
+class CachedTokenAuthenticationTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.token = Token.objects.create(user=self.user)
+        # Кэш процесса одного «воркера»; второй экземпляр — другой воркер
+        patcher = mock.patch(
+            'users.authentication.token_cache', TokenCache(10, 60)
+        )
+        self.token_cache = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_delete_in_other_worker(self):
+        first = TokenCache(10, 60)
+        second = TokenCache(10, 60)
+        key = self.token.key
+        first.set(key, (self.user, self.token), first.generation(key))
+        self.assertIsNotNone(first.get(key))
+        second.delete(key)
+        self.assertIsNone(first.get(key))
+
+    def test_logout_revokes_cached_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(self.client.get(ME_URL).status_code, 200)
+        self.assertIsNotNone(self.token_cache.get(self.token.key))
+        self.assertEqual(self.client.post(LOGOUT_URL).status_code, 204)
+        self.assertEqual(self.client.get(ME_URL).status_code, 401)
+
+    def test_returns_detached_user(self):
+        authentication = CachedTokenAuthentication()
+        first, token = authentication.authenticate_credentials(self.token.key)
+        first._state.fields_cache['marker'] = object()
+        with self.assertNumQueries(0):
+            second, _ = authentication.authenticate_credentials(
+                self.token.key
+            )
+        self.assertEqual(second.pk, first.pk)
+        self.assertIsNot(second, first)
+        self.assertNotIn('marker', second._state.fields_cache)
+        self.assertIs(token.user, first)
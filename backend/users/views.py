@@ -1,10 +1,13 @@
+from collections import defaultdict
+
 from djoser.views import UserViewSet as BaseUserViewSet
-from rest_framework import status
+from rest_framework import serializers, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from recipes.models import User
+from recipes.counters import add_relation, remove_relation
+from recipes.models import Recipe, User
 from recipes.paginators import StandardResultsSetPagination
 from users.serializers import (
     PasswordChangeSerializer,
@@ -60,21 +63,25 @@ class UserViewSet(BaseUserViewSet):
                     {'detail': 'Нельзя подписываться на самого себя.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            if request.user.subscriptions.filter(id=user.id).exists():
+            if not add_relation(
+                User, user.id, 'subscribers', 'subscribers_count',
+                request.user, 'subscriptions'
+            ):
                 return Response(
                     {'detail': 'Вы уже подписаны на этого пользователя.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            request.user.subscriptions.add(user)
             serializer = SubscriberSerializer(
                 user, context={'request': request}
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            if request.user.subscriptions.filter(id=user.id).exists():
-                request.user.subscriptions.remove(user)
+            if remove_relation(
+                User, user.id, 'subscribers', 'subscribers_count',
+                request.user, 'subscriptions'
+            ):
                 return Response(status=status.HTTP_204_NO_CONTENT)
             else:
                 return Response(
@@ -87,6 +94,17 @@ class UserViewSet(BaseUserViewSet):
     )
     def subscriptions(self, request):
         if request.method == 'GET':
+            recipes_limit = request.query_params.get('recipes_limit')
+            if recipes_limit is not None:
+                if not recipes_limit.isdigit():
+                    raise serializers.ValidationError(
+                        {
+                            'recipes_limit':
+                                'Это поле должно быть целым числом.'
+                        }
+                    )
+                recipes_limit = int(recipes_limit)
+
             subscriptions = request.user.subscriptions.all()
 
             paginator = StandardResultsSetPagination()
@@ -94,6 +112,14 @@ class UserViewSet(BaseUserViewSet):
                 subscriptions, request
             )
 
+            recipe_previews = defaultdict(list)
+            for recipe in Recipe.objects.limited_per_author(
+                [author.id for author in paginate_queryset], recipes_limit
+            ):
+                recipe_previews[recipe.author_id].append(recipe)
+            for author in paginate_queryset:
+                author.recipe_previews = recipe_previews[author.id]
+
             serializer = SubscriberSerializer(
                 paginate_queryset, many=True, context={'request': request}
             )